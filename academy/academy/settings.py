@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
+import hashlib
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -152,8 +153,66 @@ STATIC_URL = '/static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Caches
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# ``photoschool`` is the L2 tier of the photoschool cache, shared by every worker of this checkout.
+# Its entries are keyed by database ids, so the key prefix is derived from the database name, and
+# the cache directory must be emptied whenever that database is re-created. Any other backend
+# shared by all workers fits too, e.g. ``django_redis.cache.RedisCache``, given the same prefix.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'photoschool': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / '.cache' / 'photoschool',
+        'KEY_PREFIX': hashlib.sha256(str(DATABASES['default']['NAME']).encode()).hexdigest()[:16],
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+
+PHOTOSCHOOL_CACHE_ALIAS = 'photoschool'
+# Seconds per namespace.
+PHOTOSCHOOL_CACHE_TIMEOUTS = {
+    'version': 24 * 60 * 60,
+    'token': 60,
+    'curriculum': 24 * 60 * 60,
+    'enrollment': 5 * 60,
+}
+# Entries kept in each process's L1 per namespace. Tokens stay out of L1, so a revoked token is
+# refused by every worker sharing L2 at once.
+PHOTOSCHOOL_CACHE_LOCAL_SIZES = {
+    'version': 1024,
+    'token': 0,
+    'curriculum': 64,
+    'enrollment': 4,
+}
+
+# Background tasks, such as unlocking a new lesson for every student, run on a worker thread once
+# the request's transaction commits. Eager tasks run in the committing request instead.
+PHOTOSCHOOL_TASKS_EAGER = False
+PHOTOSCHOOL_TASK_RETRIES = 5
+# Seconds before the first retry, doubled for each one after it.
+PHOTOSCHOOL_TASK_RETRY_DELAY = 0.1
+
 REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'photoschool.authentication.CachedTokenAuthentication',
+        'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+    ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated'
-    ]
+    ],
+    # orjson-backed when it is installed, DRF's json implementation otherwise.
+    'DEFAULT_RENDERER_CLASSES': [
+        'photoschool.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'photoschool.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
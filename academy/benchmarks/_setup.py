@@ -0,0 +1,38 @@
+"""Shared bootstrap for the benchmark scripts.
+
+Benchmarks run against a throwaway SQLite database built straight from the models,
+so they never touch ``db.sqlite3``. Run them from the ``academy`` directory, e.g.
+``python benchmarks/bench_submissions.py``.
+"""
+import hashlib
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'academy.settings')
+
+
+def setup_django():
+    import django
+    from django.conf import settings
+
+    database = Path(tempfile.mkdtemp()) / 'benchmark.sqlite3'
+    settings.DATABASES['default']['NAME'] = database
+    settings.DATABASES['default']['OPTIONS'] = {'timeout': 30}
+    # The shared cache tier is keyed by the database, as in settings.
+    settings.CACHES['photoschool']['KEY_PREFIX'] = hashlib.sha256(str(database).encode()).hexdigest()[:16]
+    django.setup()
+    settings.MIGRATION_MODULES = {app.label: None for app in django.apps.apps.get_app_configs()}
+
+    from django.core.management import call_command
+    call_command('migrate', run_syncdb=True, verbosity=0)
+
+
+def timed(function, *args, **kwargs):
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - started, result
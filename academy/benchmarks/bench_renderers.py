@@ -0,0 +1,101 @@
+"""JSON rendering and parsing: DRF's stock ``json`` classes against the ``orjson`` ones.
+
+Payloads are the real response bodies of the lesson approve list, the lesson history and the
+studying list, captured by calling the views.
+
+    python benchmarks/bench_renderers.py --lessons 1000 --versions 500 --repeat 20
+"""
+import argparse
+import io
+
+from _setup import setup_django, timed
+
+setup_django()
+
+import reversion  # noqa: E402
+from django.conf import settings  # noqa: E402
+from model_bakery import baker  # noqa: E402
+from rest_framework.parsers import JSONParser  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+from rest_framework.test import APIRequestFactory, force_authenticate  # noqa: E402
+
+from photoschool import views  # noqa: E402
+from photoschool.importers import import_lessons  # noqa: E402
+from photoschool.models import Lesson, Program, Student, Studying  # noqa: E402
+from photoschool.renderers import ORJSONParser, ORJSONRenderer, orjson  # noqa: E402
+from users.models import CustomUser  # noqa: E402
+
+THEORY = 'Expose for the highlights, then lift the shadows in post. ' * 34
+
+
+def lesson_rows(lessons, prefix):
+    return (
+        (number, {'title': f'{prefix} lesson {number}', 'theory': THEORY, 'practice': 'Practice', 'answer': 'answer'})
+        for number in range(lessons)
+    )
+
+
+def seed(lessons, versions):
+    editor = baker.make(CustomUser, is_editor=True)
+    manager = baker.make(CustomUser, is_superuser=True)
+    import_lessons(baker.make(Program).pk, lesson_rows(lessons, 'Draft'), editor)
+    import_lessons(baker.make(Program).pk, lesson_rows(lessons, 'Published'), editor, is_approved=True)
+
+    lesson = Lesson.objects.filter(is_approved=True).first()
+    for number in range(versions):
+        with reversion.create_revision():
+            reversion.set_user(editor)
+            lesson.title = f'Revision {number}'
+            lesson.save()
+
+    student = baker.make(Student)
+    Studying.objects.bulk_create(Studying(student=student, lesson=lesson) for lesson in Lesson.objects.filter(
+        is_approved=True
+    ))
+    return manager, student.user, lesson
+
+
+def capture(view, user, path, **kwargs):
+    # Paginated views build absolute links from the request host.
+    settings.ALLOWED_HOSTS = ['testserver']
+    request = APIRequestFactory().get(path)
+    force_authenticate(request, user)
+    return view(request, **kwargs).data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lessons', type=int, default=1000)
+    parser.add_argument('--versions', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=20)
+    options = parser.parse_args()
+
+    if orjson is None:
+        print('orjson is not installed, both columns use the json module.')
+    manager, student_user, lesson = seed(options.lessons, options.versions)
+    payloads = (
+        ('lessons', capture(views.LessonForApproveListAPIView.as_view(), manager, '/')),
+        ('history', capture(views.LessonHistoryRollBackAPIView.as_view(), manager, '/?limit=500', pk=lesson.pk)),
+        ('studying', capture(views.StudyingViewSet.as_view({'get': 'list'}), student_user, '/')),
+    )
+
+    def repeat(function, *args):
+        return timed(lambda: [function(*args) for _ in range(options.repeat)])[0] / options.repeat * 1000
+
+    print(
+        f'{"payload":<10}{"items":>7}{"kB":>8}{"render ms":>11}{"orjson ms":>11}'
+        f'{"parse ms":>10}{"orjson ms":>11}'
+    )
+    for name, data in payloads:
+        content = JSONRenderer().render(data)
+        assert ORJSONRenderer().render(data) == content, f'{name} renders differently'
+        print(
+            f'{name:<10}{len(data):>7}{len(content) / 1024:>8.0f}'
+            f'{repeat(JSONRenderer().render, data):>11.2f}{repeat(ORJSONRenderer().render, data):>11.2f}'
+            f'{repeat(lambda: JSONParser().parse(io.BytesIO(content))):>10.2f}'
+            f'{repeat(lambda: ORJSONParser().parse(io.BytesIO(content))):>11.2f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""List serialization: DRF ``ModelSerializer``s against the lean ``.values()`` serializers.
+
+Both paths render to JSON bytes, which are checked to be identical before timings are shown.
+
+    python benchmarks/bench_serializers.py --sizes 1000 10000 100000
+"""
+import argparse
+
+from _setup import setup_django, timed
+
+setup_django()
+
+from django.contrib.contenttypes.models import ContentType  # noqa: E402
+from django.db.models import Sum  # noqa: E402
+from django.db.models.functions import Coalesce  # noqa: E402
+from model_bakery import baker  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+from reversion.models import Version  # noqa: E402
+
+from photoschool.importers import import_lessons  # noqa: E402
+from photoschool.lean import (  # noqa: E402
+    LeanLessonSerializer, LeanStudentLessonsPassedSerializer, LeanStudyingSerializer
+)
+from photoschool.models import Lesson, Program, PublishedVersion, Student, StudentProgress, Studying  # noqa: E402
+from photoschool.serializers import (  # noqa: E402
+    LessonSerializer, StudentLessonsPassedSerializer, StudyingSerializer
+)
+from users.models import CustomUser  # noqa: E402
+
+
+def seed(size):
+    editor = baker.make(CustomUser, is_editor=True)
+    program = baker.make(Program)
+    rows = (
+        (number, {'title': f'Lesson {number}', 'theory': 'Theory ' * 200, 'practice': 'Practice', 'answer': 'answer'})
+        for number in range(size)
+    )
+    import_lessons(program.pk, rows, editor, is_approved=True, chunk_size=5000)
+
+    content_type = ContentType.objects.get_for_model(Lesson)
+    PublishedVersion.objects.bulk_create((
+        PublishedVersion(
+            content_type=content_type, object_id=version.object_id, version=version,
+            field_dict={**version.field_dict, 'editor': editor.username},
+        )
+        for version in Version.objects.get_for_model(Lesson).iterator(chunk_size=5000)
+    ), batch_size=5000)
+
+    student = baker.make(Student)
+    Studying.objects.bulk_create(
+        (Studying(student=student, lesson_id=lesson_id) for lesson_id in Lesson.objects.values_list('id', flat=True)),
+        batch_size=5000,
+    )
+    students = baker.make(Student, _quantity=size)
+    StudentProgress.objects.bulk_create(
+        (StudentProgress(student=student, program=program, passed_count=1) for student in students), batch_size=5000
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    options = parser.parse_args()
+
+    seed(max(options.sizes))
+    render = JSONRenderer().render
+    cases = (
+        ('lessons', LessonSerializer, LeanLessonSerializer, Lesson.objects.all()),
+        ('studying', StudyingSerializer, LeanStudyingSerializer, Studying.objects.select_related('lesson')),
+        (
+            'passed', StudentLessonsPassedSerializer, LeanStudentLessonsPassedSerializer,
+            Student.objects.annotate(amount_passed_lesson=Coalesce(Sum('progress__passed_count'), 0)),
+        ),
+    )
+
+    print(f'{"endpoint":<10}{"rows":>8}{"drf s":>10}{"lean s":>10}{"speedup":>9}')
+    for size in options.sizes:
+        for name, serializer, lean, queryset in cases:
+            drf_seconds, drf_json = timed(lambda: render(serializer(queryset[:size], many=True).data))
+            lean_seconds, lean_json = timed(lambda: render(lean(queryset[:size]).data))
+            assert drf_json == lean_json, f'{name} output differs'
+            print(f'{name:<10}{size:>8}{drf_seconds:>10.3f}{lean_seconds:>10.3f}{drf_seconds / lean_seconds:>8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Answer submissions per second: ``Studying.save`` against ``Studying.submit``.
+
+Every client thread walks its own students through the whole program, submitting the
+right answer to each lesson in turn, the way ``StudyingViewSet`` PATCH requests do.
+
+    python benchmarks/bench_submissions.py --clients 1 4 8 --students 40 --lessons 25
+"""
+import argparse
+import threading
+
+from _setup import setup_django, timed
+
+setup_django()
+
+from django.db import connection  # noqa: E402
+from model_bakery import baker  # noqa: E402
+
+from photoschool import tasks  # noqa: E402
+from photoschool.models import Lesson, Program, Student, Studying  # noqa: E402
+from users.models import CustomUser  # noqa: E402
+
+
+def save_path(studying_id, answer):
+    studying = Studying.objects.select_related('lesson').get(pk=studying_id)
+    studying.answer = answer
+    studying.save()
+
+
+def submit_path(studying_id, answer):
+    studying = Studying.objects.select_related('lesson').get(pk=studying_id)
+    studying.submit(answer)
+
+
+def seed(students, lessons):
+    editor = baker.make(CustomUser, is_editor=True)
+    program = baker.make(Program)
+    chain = [
+        Lesson.objects.create(program=program, editor=editor, title=f'Lesson {number}', answer=f'answer {number}')
+        for number in range(lessons)
+    ]
+    # The unlock passes queued by the new lessons must not write during the timed runs.
+    tasks.wait()
+    return chain, baker.make(Student, _quantity=students)
+
+
+def run(path, clients, students, chain):
+    Studying.objects.all().delete()
+    Studying.objects.bulk_create(Studying(student=student, lesson=chain[0]) for student in students)
+    rows = dict(Studying.objects.values_list('student_id', 'id'))
+
+    def client(client_students):
+        for student in client_students:
+            studying_id = rows[student.pk]
+            for lesson, next_lesson in zip(chain, chain[1:] + [None]):
+                path(studying_id, lesson.answer)
+                if next_lesson is not None:
+                    studying_id = Studying.objects.values_list('id', flat=True).get(
+                        student=student, lesson=next_lesson
+                    )
+        connection.close()
+
+    threads = [threading.Thread(target=client, args=(students[number::clients],)) for number in range(clients)]
+    elapsed, _ = timed(lambda: [thread.start() for thread in threads] and [thread.join() for thread in threads])
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--students', type=int, default=40)
+    parser.add_argument('--lessons', type=int, default=25)
+    options = parser.parse_args()
+
+    chain, students = seed(options.students, options.lessons)
+    submissions = options.students * options.lessons
+
+    print(f'{"path":<8}{"clients":>8}{"submissions":>13}{"seconds":>10}{"per second":>12}')
+    for clients in options.clients:
+        for name, path in (('save', save_path), ('submit', submit_path)):
+            elapsed = run(path, clients, students, chain)
+            print(f'{name:<8}{clients:>8}{submissions:>13}{elapsed:>10.2f}{submissions / elapsed:>12.0f}')
+
+
+if __name__ == '__main__':
+    main()
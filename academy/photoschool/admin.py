@@ -35,4 +35,10 @@ class LessonAdmin(admin.ModelAdmin):
     list_display_links = ('id', 'user')
 
 
+@admin.register(StudentProgress)
+class StudentProgressAdmin(admin.ModelAdmin):
+    list_display = ('id', 'student', 'program', 'passed_count', 'total_lessons', 'last_activity')
+    list_display_links = ('id', 'student')
+
+
 admin.site.register(Theme)
@@ -0,0 +1,19 @@
+from rest_framework.authentication import TokenAuthentication
+
+from .cache import token_cache
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Token authentication that skips the token and user lookup while the token is cached.
+
+    Failed lookups are never cached, and deleting a token (as logout does) revokes it through
+    the ``evict_deleted_token`` signal handler.
+    """
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            return cached
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, user, token)
+        return user, token
@@ -0,0 +1,306 @@
+"""Caching tier of the photoschool app.
+
+Every kind of cached data gets its own ``TieredCache`` namespace: an in-process LRU (L1) in front
+of the shared Django cache named by ``PHOTOSCHOOL_CACHE_ALIAS`` (L2). Keys look like
+``photoschool:<namespace>:<key>``, timeouts and L1 sizes are set per namespace in settings, and
+hit/miss counters are kept per namespace so each tier can be sized.
+"""
+import copy
+import hashlib
+import pickle
+import time
+from collections import Counter, OrderedDict
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import caches
+from reversion.models import Version
+
+DEFAULT_TIMEOUTS = {'version': 24 * 60 * 60, 'token': 60, 'curriculum': 24 * 60 * 60, 'enrollment': 5 * 60}
+DEFAULT_LOCAL_SIZES = {'version': 1024, 'token': 0, 'curriculum': 64, 'enrollment': 4}
+
+# Namespaces built by ``tiered_cache``, reported by the cache stats endpoint.
+namespaces = {}
+
+
+class LRUCache:
+    """Thread-safe, size-bounded in-process cache evicting the least recently used key."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class TieredCache:
+    """One namespace of the photoschool cache, read through L1 and then L2.
+
+    ``timeout`` applies to both tiers, None keeps entries until they are evicted or deleted.
+    A ``generational`` namespace stores its generation in L2 and puts it in every key, so
+    ``invalidate()`` drops all of its entries in every process at once.
+    """
+
+    def __init__(self, namespace, timeout=None, local_size=1024, alias=None, generational=False):
+        self.namespace = namespace
+        self.key_prefix = f'photoschool:{namespace}:'
+        self.timeout = timeout
+        self.local = LRUCache(local_size)
+        self.alias = alias
+        self.generational = generational
+        self.counters = Counter()
+        self._counters_lock = Lock()
+        self._local_generation = 1
+
+    @property
+    def shared(self):
+        if self.alias:
+            return caches[self.alias]
+
+    def get(self, key, default=None):
+        cache_key = self._cache_key(key)
+        entry = self.local.get(cache_key)
+        if entry is not None:
+            if not self._expired(entry):
+                self._count('l1_hits')
+                return entry[1]
+            self.local.delete(cache_key)
+
+        shared = self.shared
+        if shared is not None:
+            entry = shared.get(cache_key)
+            if entry is not None and not self._expired(entry):
+                self._count('l2_hits')
+                # The L1 copy keeps the L2 deadline, so it never outlives the shared entry.
+                self.local.set(cache_key, entry)
+                return entry[1]
+
+        self._count('misses')
+        return default
+
+    def set(self, key, value):
+        cache_key = self._cache_key(key)
+        self._count('sets')
+        entry = (self._deadline(), value)
+        self.local.set(cache_key, entry)
+        shared = self.shared
+        if shared is not None:
+            shared.set(cache_key, entry, self.timeout)
+
+    def get_or_set(self, key, build):
+        value = self.get(key)
+        if value is None:
+            value = build()
+            self.set(key, value)
+        return value
+
+    def delete(self, key):
+        cache_key = self._cache_key(key)
+        self._count('deletes')
+        self.local.delete(cache_key)
+        shared = self.shared
+        if shared is not None:
+            shared.delete(cache_key)
+
+    def invalidate(self):
+        """Move a generational namespace to its next generation, orphaning every entry."""
+        self._count('invalidations')
+        self.local.clear()
+        shared = self.shared
+        if shared is None:
+            self._local_generation += 1
+            return
+        generation_key = self.key_prefix + 'generation'
+        try:
+            shared.incr(generation_key)
+        except ValueError:
+            shared.add(generation_key, 2, None)
+
+    def clear(self):
+        """Drop this process's L1 entries and counters; L2 entries are left to their timeout."""
+        self.local.clear()
+        with self._counters_lock:
+            self.counters.clear()
+
+    def stats(self):
+        with self._counters_lock:
+            counters = dict(self.counters)
+        return {
+            'l1_hits': counters.get('l1_hits', 0),
+            'l2_hits': counters.get('l2_hits', 0),
+            'misses': counters.get('misses', 0),
+            'sets': counters.get('sets', 0),
+            'deletes': counters.get('deletes', 0),
+            'invalidations': counters.get('invalidations', 0),
+            'l1_size': len(self.local),
+            'l1_max_size': self.local.max_size,
+            'timeout': self.timeout,
+        }
+
+    def _cache_key(self, key):
+        if not self.generational:
+            return f'{self.key_prefix}{key}'
+        return f'{self.key_prefix}{self._generation()}:{key}'
+
+    def _generation(self):
+        shared = self.shared
+        if shared is None:
+            return self._local_generation
+        generation_key = self.key_prefix + 'generation'
+        generation = shared.get(generation_key)
+        if generation is None:
+            shared.add(generation_key, 1, None)
+            generation = shared.get(generation_key, 1)
+        return generation
+
+    def _deadline(self):
+        # Wall-clock time, as the deadline is shared with other processes through L2.
+        if self.timeout is None:
+            return None
+        return time.time() + self.timeout
+
+    @staticmethod
+    def _expired(entry):
+        return entry[0] is not None and entry[0] <= time.time()
+
+    def _count(self, name):
+        with self._counters_lock:
+            self.counters[name] += 1
+
+
+def tiered_cache(namespace, **kwargs):
+    """Build a namespace configured by ``PHOTOSCHOOL_CACHE_TIMEOUTS`` and ``PHOTOSCHOOL_CACHE_LOCAL_SIZES``."""
+    timeouts = {**DEFAULT_TIMEOUTS, **getattr(settings, 'PHOTOSCHOOL_CACHE_TIMEOUTS', {})}
+    local_sizes = {**DEFAULT_LOCAL_SIZES, **getattr(settings, 'PHOTOSCHOOL_CACHE_LOCAL_SIZES', {})}
+    cache = namespaces[namespace] = TieredCache(
+        namespace,
+        timeout=timeouts[namespace],
+        local_size=local_sizes[namespace],
+        alias=getattr(settings, 'PHOTOSCHOOL_CACHE_ALIAS', None),
+        **kwargs
+    )
+    return cache
+
+
+class VersionCache:
+    """Parsed reversion versions keyed by version id.
+
+    A version row never changes once written, but its id is reused when the database is re-created,
+    so entries still expire with the namespace timeout.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def field_dict(self, version, editor_field='username'):
+        """Return a fresh copy of the field dict of a version (or version id) with its editor."""
+        entry = self._get_entry(version)
+        field_dict = copy.copy(entry['field_dict'])
+        field_dict['editor'] = entry['editor'][editor_field]
+        return field_dict
+
+    def delete(self, version_id):
+        self.cache.delete(version_id)
+
+    def clear(self):
+        self.cache.clear()
+
+    def _get_entry(self, version):
+        version_id = version.pk if isinstance(version, Version) else int(version)
+        entry = self.cache.get(version_id)
+        if entry is None:
+            if not isinstance(version, Version):
+                version = Version.objects.select_related('revision__user').get(pk=version_id)
+            user = version.revision.user
+            entry = {
+                'field_dict': version.field_dict,
+                'editor': {
+                    'username': user.username if user else None,
+                    'first_name': user.first_name if user else None,
+                },
+            }
+            self.cache.set(version_id, entry)
+        return entry
+
+
+class TokenCache:
+    """Users resolved from auth tokens, kept for the namespace timeout.
+
+    Pairs are stored pickled under a digest of the token key, so every request gets its own objects.
+    ``revoke()`` evicts single tokens from L2 and this process's L1. It reaches other processes at
+    once only when L2 is shared between them and tokens are kept out of L1 (its size is 0 by
+    default); otherwise their copies live until the timeout.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def get(self, key):
+        """Return the cached ``(user, token)`` pair for a token key, or None."""
+        data = self.cache.get(self._digest(key))
+        if data is not None:
+            return pickle.loads(data)
+
+    def set(self, key, user, token):
+        self.cache.set(self._digest(key), pickle.dumps((user, token)))
+
+    def revoke(self, *keys):
+        """Drop the given tokens, e.g. after a token is deleted or its user changes."""
+        for key in keys:
+            self.cache.delete(self._digest(key))
+
+    def clear(self):
+        self.cache.clear()
+
+    @staticmethod
+    def _digest(key):
+        # Raw token keys never leave the process.
+        return hashlib.sha256(key.encode()).hexdigest()
+
+
+class CurriculumCache:
+    """Published curriculum trees of programs, keyed by program id and content generation.
+
+    Any change to a program's published content bumps its generation, which makes the old
+    entries unreachable; they are left to expire on their own.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def get_or_build(self, program_id, generation, build):
+        return self.cache.get_or_set(f'{program_id}:{generation}', build)
+
+    def clear(self):
+        self.cache.clear()
+
+
+version_cache = VersionCache(tiered_cache('version'))
+token_cache = TokenCache(tiered_cache('token'))
+curriculum_cache = CurriculumCache(tiered_cache('curriculum'))
+enrollment_cache = tiered_cache('enrollment', generational=True)
@@ -0,0 +1,84 @@
+"""Sparse fieldsets: the ``fields`` and ``omit`` query parameters of GET requests.
+
+Both take comma separated field names, e.g. ``?fields=id,title`` or ``?omit=theory,answer``.
+A dotted ``name.key`` selects or drops one key of a field holding a dict, such as
+``?fields=id,actual_lesson.title``. Unknown names are ignored, and requests that write keep
+every field.
+"""
+from rest_framework import serializers
+
+
+class Fieldset:
+    """Which fields, and which keys of dict fields, a request asks for."""
+    fields_query_param = 'fields'
+    omit_query_param = 'omit'
+
+    def __init__(self, request=None):
+        params = request.query_params if request is not None and request.method in ('GET', 'HEAD') else {}
+        # Name -> None for the whole field, or the set of its keys named in the parameter.
+        self.fields = self._parse(params.get(self.fields_query_param))
+        self.omit = self._parse(params.get(self.omit_query_param)) or {}
+
+    @staticmethod
+    def _parse(value):
+        if not value:
+            return None
+        names = {}
+        for item in value.split(','):
+            name, _, key = item.strip().partition('.')
+            if not name:
+                continue
+            if not key:
+                names[name] = None
+            elif names.setdefault(name, set()) is not None:
+                names[name].add(key)
+        return names
+
+    def __bool__(self):
+        return self.fields is not None or bool(self.omit)
+
+    def keep(self, names):
+        """The given field names the response should carry, in their order."""
+        return [
+            name for name in names
+            if (self.fields is None or name in self.fields) and (name not in self.omit or self.omit[name] is not None)
+        ]
+
+    def keep_keys(self, name, keys):
+        """The given keys of the dict field ``name`` the response should carry, in their order."""
+        wanted = None if self.fields is None else self.fields.get(name)
+        dropped = self.omit.get(name) or ()
+        return [key for key in keys if (wanted is None or key in wanted) and key not in dropped]
+
+    def filter_dict(self, name, value):
+        if value is None or (self.fields is None or self.fields.get(name) is None) and not self.omit.get(name):
+            return value
+        return {key: value[key] for key in self.keep_keys(name, value)}
+
+
+def get_fieldset(request):
+    """Return the fieldset of the request, parsing it only once per request."""
+    if request is None:
+        return Fieldset()
+    fieldset = getattr(request, '_photoschool_fieldset', None)
+    if fieldset is None:
+        fieldset = request._photoschool_fieldset = Fieldset(request)
+    return fieldset
+
+
+class SparseFieldsetMixin:
+    """Serializer mixin dropping the fields left out by the request's fieldset.
+
+    Only the outermost serializer of a response is filtered, nested ones keep all their fields.
+    """
+
+    @property
+    def fieldset(self):
+        parent = self.parent.parent if isinstance(self.parent, serializers.ListSerializer) else self.parent
+        if parent is not None:
+            return Fieldset()
+        return get_fieldset(self.context.get('request'))
+
+    def get_fields(self):
+        fields = super().get_fields()
+        return {name: fields[name] for name in self.fieldset.keep(fields)}
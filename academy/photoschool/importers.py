@@ -0,0 +1,119 @@
+import csv
+import json
+from itertools import islice
+
+from django.contrib.contenttypes.models import ContentType
+from django.core import serializers as django_serializers
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from reversion.models import Revision, Version
+from rest_framework.exceptions import ValidationError
+
+from .models import Program, Lesson, Studying, StudentProgress
+from .serializers import LessonImportSerializer
+from .tasks import run_after_commit
+
+IMPORT_FORMATS = ('jsonl', 'csv')
+IMPORT_CHUNK_SIZE = 500
+
+
+def read_rows(lines, file_format):
+    """Yield ``(line_number, row)`` pairs from an iterable of JSON-lines or CSV text lines."""
+    if file_format == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, {key: value if value != '' else None for key, value in row.items()}
+    elif file_format == 'jsonl':
+        for line_number, line in enumerate(lines, start=1):
+            if line.strip():
+                try:
+                    yield line_number, json.loads(line)
+                except ValueError:
+                    raise ValidationError({'line': line_number, 'errors': 'Invalid JSON.'})
+    else:
+        raise ValidationError({'file_format': f'Expected one of {", ".join(IMPORT_FORMATS)}.'})
+
+
+def import_lessons(program_id, rows, editor, is_approved=False, chunk_size=IMPORT_CHUNK_SIZE):
+    """Append lessons to the end of a program's chain and return how many were imported.
+
+    Rows are validated and inserted one chunk at a time, so memory stays bounded by ``chunk_size``.
+    Each chunk gets a single reversion revision holding the initial versions of its lessons.
+    """
+    with transaction.atomic():
+        program = Program.lock_chain(program_id)
+        theme_ids = set(program.themes.values_list('id', flat=True))
+
+        rows = iter(rows)
+        imported = 0
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            lessons = _build_lessons(chunk, program, editor, is_approved, theme_ids)
+            program.tail_lesson_id = _insert_lessons(lessons, program.tail_lesson_id, editor)
+            if not imported:
+                # Only the first lesson follows one that students may have passed already.
+                run_after_commit(Studying.objects.unlock_lesson, lessons[0].pk)
+            program.head_lesson_id = program.head_lesson_id or lessons[0].pk
+            imported += len(lessons)
+
+        program.save_chain()
+        StudentProgress.objects.filter(program_id=program_id).update(total_lessons=F('total_lessons') + imported)
+    return imported
+
+
+def _build_lessons(chunk, program, editor, is_approved, theme_ids):
+    lessons = []
+    for line_number, row in chunk:
+        serializer = LessonImportSerializer(data=row)
+        if not serializer.is_valid():
+            raise ValidationError({'line': line_number, 'errors': serializer.errors})
+        data = serializer.validated_data
+        theme_id = data.pop('theme', None)
+        if theme_id is not None and theme_id not in theme_ids:
+            raise ValidationError({'line': line_number, 'errors': {'theme': 'Theme does not belong to the program.'}})
+        data['answer'] = data['answer'].lower()
+        lessons.append(Lesson(
+            program=program, editor=editor, theme_id=theme_id, is_approved=is_approved, **data
+        ))
+
+    titles = [lesson.title for lesson in lessons]
+    taken = set(Lesson.objects.filter(title__in=titles).values_list('title', flat=True))
+    seen = set()
+    for (line_number, row), title in zip(chunk, titles):
+        if title in taken or title in seen:
+            raise ValidationError({'line': line_number, 'errors': {'title': 'Lesson with this title already exists.'}})
+        seen.add(title)
+    return lessons
+
+
+def _insert_lessons(lessons, tail_lesson_id, editor):
+    # A row cannot reference ids from its own INSERT, so links inside the chunk are set afterwards.
+    lessons[0].parent_id = tail_lesson_id
+    Lesson.objects.bulk_create(lessons)
+    if lessons[0].pk is None:
+        ids = dict(Lesson.objects.filter(title__in=[lesson.title for lesson in lessons]).values_list('title', 'id'))
+        for lesson in lessons:
+            lesson.pk = ids[lesson.title]
+
+    for parent, lesson in zip(lessons, lessons[1:]):
+        lesson.parent_id = parent.pk
+    Lesson.objects.bulk_update(lessons[1:], ['parent'])
+
+    revision = Revision.objects.create(date_created=timezone.now(), user=editor, comment='Imported lessons')
+    content_type = ContentType.objects.get_for_model(Lesson)
+    Version.objects.bulk_create(
+        Version(
+            revision=revision,
+            content_type=content_type,
+            object_id=str(lesson.pk),
+            db=Lesson.objects.db,
+            format='json',
+            serialized_data=django_serializers.serialize('json', (lesson,)),
+            object_repr=str(lesson),
+        )
+        for lesson in lessons
+    )
+    return lessons[-1].pk
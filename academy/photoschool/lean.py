@@ -0,0 +1,218 @@
+"""Read-only serializers for hot list endpoints, working on ``.values()`` rows.
+
+Each lean serializer mirrors a ``ModelSerializer`` and produces the same keys, in the same
+order and with the same values, so rendered JSON is byte-identical. Its fields are inspected
+once per class and turned into plain extractors, instead of running DRF field machinery for
+every value of every row.
+"""
+from itertools import islice
+from operator import attrgetter, itemgetter
+
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.db.models import QuerySet
+from django.http import StreamingHttpResponse
+from django.utils.functional import cached_property
+from rest_framework import serializers
+from rest_framework.response import Response
+
+from .fieldsets import get_fieldset
+from .models import Lesson, PublishedVersion
+from .renderers import ORJSONRenderer
+from .serializers import (
+    LessonSerializer, ProgramShortSerializer, StudentLessonsPassedSerializer, StudentShortSerializer,
+    StudyingSerializer
+)
+
+# Fields whose representation of a database value is the value itself.
+PASSTHROUGH_FIELDS = (
+    serializers.BooleanField, serializers.CharField, serializers.IntegerField, serializers.PrimaryKeyRelatedField,
+    serializers.ReadOnlyField,
+)
+
+
+class LeanSerializer:
+    """Serialize a queryset (read through ``.values()``) or a list of already loaded objects.
+
+    Subclasses name the mirrored ``serializer_class`` and implement ``get_<name>(row)`` for each
+    of its method fields, with lookups shared by all rows done once in ``prepare(rows)``.
+    ``method_sources`` names the fields each getter reads, so a sparse fieldset leaving those
+    fields out of the response still selects them.
+    """
+    serializer_class = None
+    method_sources = {}
+    _compiled = None
+
+    def __init__(self, instance, many=True, context=None):
+        if not many:
+            raise ImproperlyConfigured(f'{self.__class__.__name__} only serializes lists.')
+        self.instance = instance
+        self.context = context or {}
+        self.fieldset = get_fieldset(self.context.get('request'))
+
+    @classmethod
+    def compile(cls):
+        """Return ``(sources, extractors)``, built from the mirrored serializer on first use."""
+        if cls.__dict__.get('_compiled') is None:
+            model = cls.serializer_class.Meta.model
+            sources, extractors = [], []
+            for name, field in cls.serializer_class().fields.items():
+                if field.write_only:
+                    continue
+                if isinstance(field, serializers.SerializerMethodField):
+                    extractors.append((name, None, getattr(cls, f'get_{name}')))
+                    continue
+                if '.' in field.source or field.source == '*':
+                    raise ImproperlyConfigured(f'{cls.__name__} cannot mirror the {name!r} field.')
+                try:
+                    attname = model._meta.get_field(field.source).attname
+                except FieldDoesNotExist:
+                    attname = field.source
+                convert = None if type(field) in PASSTHROUGH_FIELDS else field.to_representation
+                sources.append((field.source, attname))
+                extractors.append((name, len(sources) - 1, convert))
+            cls._compiled = sources, extractors
+        return cls._compiled
+
+    @cached_property
+    def plan(self):
+        """``(sources, extractors)`` narrowed to the fields kept by the request's fieldset."""
+        sources, extractors = self.compile()
+        if not self.fieldset:
+            return sources, extractors
+        kept = set(self.fieldset.keep([name for name, _, _ in extractors]))
+        index_of = {name: index for name, index, _ in extractors if index is not None}
+        needed = set()
+        for name, index, _ in extractors:
+            if name not in kept:
+                continue
+            if index is not None:
+                needed.add(index)
+            else:
+                needed.update(index_of[dep] for dep in self.method_sources.get(name, ()))
+        # values_list() without names would read every column.
+        needed = sorted(needed) or [0]
+        position = {index: number for number, index in enumerate(needed)}
+        return [sources[index] for index in needed], [
+            (name, None if index is None else position[index], convert)
+            for name, index, convert in extractors if name in kept
+        ]
+
+    @property
+    def data(self):
+        sources = self.plan[0]
+        if isinstance(self.instance, QuerySet):
+            rows = list(self.instance.values_list(*[source for source, _ in sources]))
+        else:
+            getter = attrgetter(*[attname for _, attname in sources])
+            rows = [getter(obj) for obj in self.instance]
+            if len(sources) == 1:
+                rows = [(value,) for value in rows]
+        return self.serialize(rows)
+
+    def iter_chunks(self, chunk_size):
+        """Yield the serialized queryset ``chunk_size`` rows at a time, holding one chunk in memory."""
+        sources = self.plan[0]
+        rows = self.instance.values_list(*[source for source, _ in sources]).iterator(chunk_size=chunk_size)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                return
+            yield self.serialize(chunk)
+
+    def serialize(self, rows):
+        extractors = self.plan[1]
+        self.prepare(rows)
+        data = []
+        for row in rows:
+            item = {}
+            for name, index, convert in extractors:
+                if index is None:
+                    item[name] = convert(self, row)
+                    continue
+                value = row[index]
+                item[name] = value if convert is None or value is None else convert(value)
+            data.append(item)
+        return data
+
+    def prepare(self, rows):
+        """Hook for lookups shared by all rows, run before any row is serialized."""
+
+    def renders(self, name):
+        return any(name == extractor_name for extractor_name, _, _ in self.plan[1])
+
+    def column(self, source):
+        return itemgetter([source_name for source_name, _ in self.plan[0]].index(source))
+
+
+class LeanListMixin:
+    """List through ``lean_serializer_class``; every other action keeps ``serializer_class``.
+
+    Views setting ``stream_chunk_size`` also answer ``?stream=1`` with the whole, unpaginated
+    list as a streamed JSON array, read from the database and rendered one chunk at a time.
+    """
+    lean_serializer_class = None
+    stream_query_param = 'stream'
+    stream_chunk_size = None
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        context = self.get_serializer_context()
+        if self.is_streamed(request):
+            return self.stream_list(queryset, context)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.lean_serializer_class(page, context=context).data)
+        return Response(self.lean_serializer_class(queryset, context=context).data)
+
+    def is_streamed(self, request):
+        return bool(self.stream_chunk_size) and request.query_params.get(self.stream_query_param) in ('1', 'true')
+
+    def stream_list(self, queryset, context):
+        chunks = self.lean_serializer_class(queryset, context=context).iter_chunks(self.stream_chunk_size)
+        return StreamingHttpResponse(stream_json_array(chunks), content_type='application/json')
+
+
+def stream_json_array(chunks):
+    """Render lists of items as the parts of one JSON array."""
+    render = ORJSONRenderer().render
+    separator = b''
+    yield b'['
+    for chunk in chunks:
+        # Each chunk renders as a complete array; only its elements are kept.
+        yield separator + render(chunk)[1:-1]
+        separator = b','
+    yield b']'
+
+
+class LeanLessonSerializer(LeanSerializer):
+    serializer_class = LessonSerializer
+
+
+class LeanStudyingSerializer(LeanSerializer):
+    serializer_class = StudyingSerializer
+    method_sources = {'actual_lesson': ('lesson',)}
+
+    def prepare(self, rows):
+        if not self.renders('actual_lesson'):
+            return
+        self.lesson_id = self.column('lesson')
+        all_keys = PublishedVersion.objects.field_dict_keys(Lesson)
+        keys = self.fieldset.keep_keys('actual_lesson', all_keys)
+        self.actual_lessons = PublishedVersion.objects.get_field_dicts(
+            Lesson, {self.lesson_id(row) for row in rows}, None if keys == all_keys else keys
+        )
+
+    def get_actual_lesson(self, row):
+        return self.actual_lessons.get(self.lesson_id(row))
+
+
+class LeanStudentLessonsPassedSerializer(LeanSerializer):
+    serializer_class = StudentLessonsPassedSerializer
+
+
+class LeanStudentShortSerializer(LeanSerializer):
+    serializer_class = StudentShortSerializer
+
+
+class LeanProgramShortSerializer(LeanSerializer):
+    serializer_class = ProgramShortSerializer
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from photoschool.models import Program
+
+
+class Command(BaseCommand):
+    help = 'Compare the stored program enrollment and wish-list counts with the membership tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Overwrite stale counts with the counted values.')
+
+    def handle(self, *args, **options):
+        if options['fix']:
+            programs = Program.objects.refresh_counts()
+            self.stdout.write(self.style.SUCCESS(f'Fixed counts of {len(programs)} programs.'))
+            return
+
+        programs = Program.objects.stale_counts().order_by('pk')
+        for program in programs:
+            self.stdout.write(
+                f'Program {program.pk}: students {program.student_count} != {program.actual_student_count}, '
+                f'wishes {program.wish_count} != {program.actual_wish_count}'
+            )
+        if programs:
+            raise CommandError(f'{len(programs)} programs have stale counts, run with --fix to repair them.')
+        self.stdout.write(self.style.SUCCESS('All program counts are consistent.'))
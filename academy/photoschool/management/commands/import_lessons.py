@@ -0,0 +1,41 @@
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from photoschool.importers import IMPORT_CHUNK_SIZE, IMPORT_FORMATS, import_lessons, read_rows
+from photoschool.models import Program
+
+
+class Command(BaseCommand):
+    help = 'Append lessons from a JSON-lines or CSV file to the end of a program.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('program_id', type=int)
+        parser.add_argument('path')
+        parser.add_argument('--editor', required=True, help='Username recorded as the lessons editor.')
+        parser.add_argument('--file-format', choices=IMPORT_FORMATS, help='Defaults to the file extension.')
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE)
+        parser.add_argument('--approved', action='store_true', help='Import the lessons as approved.')
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        file_format = options['file_format'] or path.suffix.lstrip('.')
+        try:
+            editor = get_user_model().objects.get(username=options['editor'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'Unknown editor "{options["editor"]}".')
+
+        with path.open(encoding='utf-8', newline='') as lines:
+            try:
+                imported = import_lessons(
+                    options['program_id'], read_rows(lines, file_format), editor,
+                    is_approved=options['approved'], chunk_size=options['chunk_size'],
+                )
+            except Program.DoesNotExist:
+                raise CommandError(f'Unknown program {options["program_id"]}.')
+            except ValidationError as error:
+                raise CommandError(error.detail)
+
+        self.stdout.write(self.style.SUCCESS(f'Imported {imported} lessons.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from photoschool.models import StudentProgress
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-student progress counters from enrollments and studying rows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Rows inserted per statement.')
+
+    def handle(self, *args, **options):
+        rebuilt = StudentProgress.objects.rebuild(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt progress for {rebuilt} enrollments.'))
@@ -1,11 +1,114 @@
+from collections import Counter
+from itertools import groupby
+from operator import itemgetter
+
 import reversion
 
-from django.db import models
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections, models, transaction
+from django.db.models.functions import Coalesce
+from django.db.models.query import ModelIterable
+from django.utils import timezone
 from django.utils.functional import cached_property
 from reversion.models import Version
 
 from users.models import CustomUser
 
+from .cache import enrollment_cache
+
+
+class EditableQuerySet(models.QuerySet):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._with_published_versions = False
+
+    def with_published_versions(self):
+        """Attach the published version to every fetched object in one or two queries."""
+        clone = self._chain()
+        clone._with_published_versions = True
+        return clone
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._with_published_versions = self._with_published_versions
+        return clone
+
+    def _fetch_all(self):
+        fetched = self._result_cache is None
+        super()._fetch_all()
+        if fetched and self._with_published_versions and issubclass(self._iterable_class, ModelIterable):
+            published = PublishedVersion.objects.get_for_objects(self._result_cache)
+            for obj in self._result_cache:
+                obj._published_version = published.get(obj.pk)
+
+
+class LessonQuerySet(EditableQuerySet):
+
+    def delete(self):
+        """Delete the lessons one by one through ``Lesson.delete``, so every chain stays in one piece."""
+        deleted, rows = 0, Counter()
+        with transaction.atomic(using=self.db):
+            for lesson in self.order_by('pk'):
+                count, per_model = lesson.delete()
+                deleted += count
+                rows.update(per_model)
+        return deleted, dict(rows)
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def chain(self, program_id):
+        """Lessons of a program in curriculum order, walked with one recursive query.
+
+        Every lesson gets a zero-based ``position`` attribute.
+        """
+        quote_name = connections[self.db].ops.quote_name
+        table = quote_name(self.model._meta.db_table)
+        parent = quote_name(self.model._meta.get_field('parent').column)
+        program = quote_name(self.model._meta.get_field('program').column)
+        return self.raw(
+            f"""
+            WITH RECURSIVE chain (id, position) AS (
+                SELECT id, 0 FROM {table} WHERE {program} = %s AND {parent} IS NULL
+                UNION ALL
+                SELECT lesson.id, chain.position + 1 FROM {table} lesson JOIN chain ON lesson.{parent} = chain.id
+            )
+            SELECT lesson.*, chain.position FROM {table} lesson JOIN chain ON lesson.id = chain.id
+            ORDER BY chain.position
+            """,
+            [program_id]
+        )
+
+
+class ProgramQuerySet(EditableQuerySet):
+
+    def with_actual_counts(self):
+        """Annotate ``actual_student_count`` and ``actual_wish_count`` counted from the membership tables."""
+        return self.annotate(**{
+            f'actual_{field}': Coalesce(models.Subquery(
+                through.objects.filter(program_id=models.OuterRef('pk')).order_by().values('program_id').annotate(
+                    amount=models.Count('*')
+                ).values('amount')
+            ), 0)
+            for field, through in Program.counted_memberships().items()
+        })
+
+    def stale_counts(self):
+        """Programs whose stored enrollment or wish-list count differs from the membership tables."""
+        return self.with_actual_counts().exclude(
+            student_count=models.F('actual_student_count'), wish_count=models.F('actual_wish_count')
+        )
+
+    def refresh_counts(self):
+        """Overwrite stale counters with the counted values and return the programs that were fixed."""
+        with transaction.atomic(using=self.db):
+            programs = list(self.select_for_update().stale_counts())
+            for program in programs:
+                program.student_count, program.wish_count = program.actual_student_count, program.actual_wish_count
+            self.bulk_update(programs, ['student_count', 'wish_count'])
+        return programs
+
 
 class EditableModelMixin(models.Model):
     class Meta:
@@ -13,26 +116,176 @@ class EditableModelMixin(models.Model):
         
     title = models.CharField(max_length=100, unique=True)
     is_approved = models.BooleanField(default=False)
+
+    objects = EditableQuerySet.as_manager()
     
+    @property
+    def published_version(self):
+        if hasattr(self, '_published_version'):
+            return self._published_version
+        return PublishedVersion.objects.get_for_objects([self]).get(self.pk)
+
     @property
     def actual_version(self):
-        for version in Version.objects.get_for_object(self):
-            field_dict = version.field_dict
-            field_dict['editor'] = version.revision.user.username
-            if field_dict['is_approved']:
-                return field_dict
-    
+        published = self.published_version
+        if published is not None:
+            return published.actual_field_dict
 
-@reversion.register()
+    def approved_versions(self):
+        # Pre-filter on the serialized JSON; callers still check the parsed ``is_approved``.
+        return Version.objects.get_for_object(self).filter(serialized_data__contains='"is_approved": true')
+
+
+class PublishedVersionManager(models.Manager):
+
+    def get_for_objects(self, objs):
+        """Map object pks to their published versions.
+
+        Objects approved before the snapshot table existed are backfilled from their history. Objects
+        with no approved version get a marker row, so their history is only searched once.
+        """
+        if not objs:
+            return {}
+        return self.get_for_ids(objs[0].__class__, [obj.pk for obj in objs])
+
+    def get_for_ids(self, model, pks):
+        """Like ``get_for_objects``, for primary keys of ``model`` objects that were never loaded."""
+        object_ids = {str(pk): pk for pk in pks}
+        if not object_ids:
+            return {}
+        content_type = ContentType.objects.get_for_model(model)
+        snapshots = list(self.filter(content_type=content_type, object_id__in=object_ids))
+        published = {object_ids[snapshot.object_id]: snapshot for snapshot in snapshots if not snapshot.is_marker}
+        missing = set(object_ids) - {snapshot.object_id for snapshot in snapshots}
+        if missing:
+            versions = Version.objects.get_for_model(model).filter(
+                object_id__in=missing, serialized_data__contains='"is_approved": true'
+            ).select_related('revision__user').order_by('-pk')
+            for version in versions:
+                pk = object_ids[version.object_id]
+                if pk not in published and version.field_dict['is_approved']:
+                    published[pk] = self.publish(version)
+            self.bulk_create([
+                self.model(content_type=content_type, object_id=object_id)
+                for object_id in missing if object_ids[object_id] not in published
+            ], ignore_conflicts=True)
+        return published
+
+    def get_field_dicts(self, model, pks, keys=None):
+        """Map primary keys of ``model`` objects to their published field dicts, trimmed to ``keys``."""
+        # Keys are trimmed in Python: SQLite's JSON_EXTRACT turns "42" into 42 and true into 1.
+        published = self.get_for_ids(model, pks)
+        if keys is None:
+            return {pk: snapshot.actual_field_dict for pk, snapshot in published.items()}
+        return {pk: {key: snapshot.field_dict.get(key) for key in keys} for pk, snapshot in published.items()}
+
+    @staticmethod
+    def field_dict_keys(model):
+        """Keys of the published field dicts of ``model``, in stored order."""
+        return [field.attname for field in model._meta.concrete_fields] + ['editor']
+
+    def publish(self, version):
+        field_dict = version.field_dict
+        user = version.revision.user
+        field_dict['editor'] = user.username if user else None
+        published, _ = self.update_or_create(
+            content_type_id=version.content_type_id, object_id=version.object_id,
+            defaults={'version': version, 'field_dict': field_dict}
+        )
+        return published
+
+
+class PublishedVersion(models.Model):
+    """Latest approved version of an editable object, one row per object."""
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.CharField(max_length=191)
+    # Both are None on the marker of an object that has no approved version yet.
+    version = models.OneToOneField(Version, on_delete=models.CASCADE, related_name='published', null=True)
+    field_dict = models.JSONField(null=True)
+
+    objects = PublishedVersionManager()
+
+    class Meta:
+        unique_together = ['content_type', 'object_id']
+
+    @property
+    def is_marker(self):
+        return self.version_id is None
+
+    @property
+    def actual_field_dict(self):
+        return dict(self.field_dict)
+
+
+@reversion.register(exclude=('head_lesson', 'tail_lesson', 'student_count', 'wish_count', 'content_generation'))
 class Program(EditableModelMixin):
     description = models.TextField(max_length=255)
+    # Denormalized sizes of ``students`` and the wish lists, kept in step by the membership signals.
+    student_count = models.PositiveIntegerField(default=0, editable=False)
+    wish_count = models.PositiveIntegerField(default=0, editable=False)
+    # Bumped whenever the published curriculum of the program may have changed.
+    content_generation = models.PositiveIntegerField(default=0, editable=False)
+    # Ends of the lesson chain, kept in step by the Lesson chain operations.
+    head_lesson = models.ForeignKey(
+        'Lesson', related_name='+', on_delete=models.SET_NULL, null=True, blank=True, editable=False
+    )
+    tail_lesson = models.ForeignKey(
+        'Lesson', related_name='+', on_delete=models.SET_NULL, null=True, blank=True, editable=False
+    )
+
+    objects = ProgramQuerySet.as_manager()
 
     def __str__(self):
         return self.title
 
+    # Only changed by F() updates and the chain operations, so a full save must not write back a stale copy.
+    managed_fields = ('student_count', 'wish_count', 'content_generation', 'head_lesson', 'tail_lesson')
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.managed_fields
+            ]
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def counted_memberships():
+        return {'student_count': Student.open_programs.through, 'wish_count': Student.wish_programs.through}
+
     @cached_property
     def first_lesson(self):
-        return self.lessons.first()
+        if self.head_lesson_id is None:
+            return self.lessons.first()
+        return self.head_lesson
+
+    @classmethod
+    def lock_chain(cls, program_id):
+        """Lock the program row and return it with both chain pointers resolved."""
+        if not connections[cls.objects.db].features.has_select_for_update:
+            # SQLite has no row locks, and a transaction that read before writing fails at once while
+            # another connection writes, e.g. the unlock task; writing first waits for the lock instead.
+            cls.objects.filter(pk=program_id).update(head_lesson_id=models.F('head_lesson_id'))
+        program = cls.objects.select_for_update().only('head_lesson', 'tail_lesson').get(pk=program_id)
+        # Chains built before the pointers existed, or whose end was deleted in bulk: the ends are
+        # read from the links, as id order says nothing about a chain that was ever rearranged.
+        lessons = Lesson.objects.filter(program_id=program_id).values_list('id', flat=True)
+        if program.head_lesson_id is None:
+            program.head_lesson_id = lessons.filter(parent__isnull=True).first()
+        if program.tail_lesson_id is None:
+            program.tail_lesson_id = lessons.filter(child__isnull=True).first()
+        return program
+
+    def save_chain(self):
+        # A changed chain is a changed curriculum, so the generation moves in the same statement.
+        Program.objects.filter(pk=self.pk).update(
+            head_lesson_id=self.head_lesson_id, tail_lesson_id=self.tail_lesson_id,
+            content_generation=models.F('content_generation') + 1,
+        )
+
+    @classmethod
+    def bump_generation(cls, program_id):
+        cls.objects.filter(pk=program_id).update(content_generation=models.F('content_generation') + 1)
 
    
 @reversion.register()
@@ -49,7 +302,7 @@ class Lesson(EditableModelMixin):
     class Meta:
         ordering = ('id',)
 
-    parent = models.OneToOneField('self', related_name='child', on_delete=models.CASCADE, null=True, blank=True)
+    parent = models.OneToOneField('self', related_name='child', on_delete=models.SET_NULL, null=True, blank=True)
     editor = models.ForeignKey(CustomUser, on_delete=models.PROTECT, related_name='lessons')
     program = models.ForeignKey(Program, related_name='lessons', on_delete=models.CASCADE)
     theme = models.ForeignKey(Theme, blank=True, null=True, related_name='lessons', on_delete=models.SET_NULL)
@@ -57,17 +310,131 @@ class Lesson(EditableModelMixin):
     practice = models.CharField(max_length=150)
     answer = models.CharField(max_length=150)
 
+    objects = LessonQuerySet.as_manager()
+
     def __str__(self):
         return self.title
 
     def save(self, *args, **kwargs):
-        if self.pk is None:
-            self.answer = str(self.answer).lower()
+        if self.pk is not None:
+            return super().save(*args, **kwargs)
 
-            program_lessons = self.program.lessons.all()
-            if program_lessons:
-                self.parent = list(program_lessons)[-1]
-        super().save(*args, **kwargs)
+        self.answer = str(self.answer).lower()
+        with transaction.atomic():
+            program = Program.lock_chain(self.program_id)
+            self.parent_id = program.tail_lesson_id
+            super().save(*args, **kwargs)
+            program.head_lesson_id = program.head_lesson_id or self.pk
+            program.tail_lesson_id = self.pk
+            program.save_chain()
+            StudentProgress.objects.filter(program_id=self.program_id).update(
+                total_lessons=models.F('total_lessons') + 1
+            )
+
+    def delete(self, *args, **kwargs):
+        """Delete only this lesson, joining its neighbours and moving its students to the next lesson."""
+        with transaction.atomic():
+            program = Program.lock_chain(self.program_id)
+            child_id = self._detach(program)
+            program.save_chain()
+            progress = StudentProgress.objects.filter(program_id=self.program_id)
+            progress.filter(
+                student_id__in=Studying.objects.filter(lesson_id=self.pk, passed=True).values('student_id')
+            ).update(passed_count=models.F('passed_count') - 1)
+            progress.update(total_lessons=models.F('total_lessons') - 1)
+            if child_id is not None:
+                Studying.objects.filter(lesson_id=self.pk).exclude(
+                    student_id__in=Studying.objects.filter(lesson_id=child_id).values('student_id')
+                ).update(lesson_id=child_id, answer='', passed=False)
+                progress.filter(current_lesson_id=self.pk).update(current_lesson_id=child_id)
+            return super().delete(*args, **kwargs)
+
+    def insert_after(self, after_id):
+        """Move a newly appended lesson after ``after_id`` (or to the head when None).
+
+        Students waiting on the lesson that used to follow that position get this lesson instead.
+        """
+        with transaction.atomic():
+            program = Program.lock_chain(self.program_id)
+            self._detach(program)
+            child_id = self._attach(program, after_id)
+            program.save_chain()
+            if child_id is not None:
+                Studying.objects.filter(lesson_id=child_id, passed=False).exclude(
+                    student_id__in=Studying.objects.filter(lesson_id=self.pk).values('student_id')
+                ).update(lesson_id=self.pk, answer='')
+                StudentProgress.objects.filter(
+                    current_lesson_id=child_id,
+                    student_id__in=Studying.objects.filter(lesson_id=self.pk, passed=False).values('student_id'),
+                ).update(current_lesson_id=self.pk)
+
+    def move_after(self, after_id):
+        """Move the lesson after ``after_id`` (or to the head when None).
+
+        Students waiting on the lesson go on to the lesson that used to follow it, and students
+        waiting on the lesson that now follows it get this lesson instead.
+        """
+        with transaction.atomic():
+            program = Program.lock_chain(self.program_id)
+            if Lesson.objects.filter(pk=self.pk, parent_id=after_id).exists():
+                return
+            old_child_id = self._detach(program)
+            new_child_id = self._attach(program, after_id)
+            program.save_chain()
+            progress = StudentProgress.objects.filter(program_id=self.program_id)
+            if old_child_id is not None:
+                Studying.objects.filter(lesson_id=self.pk, passed=False).exclude(
+                    student_id__in=Studying.objects.filter(lesson_id=old_child_id).values('student_id')
+                ).update(lesson_id=old_child_id, answer='')
+                progress.filter(
+                    current_lesson_id=self.pk,
+                    student_id__in=Studying.objects.filter(lesson_id=old_child_id, passed=False).values('student_id'),
+                ).update(current_lesson_id=old_child_id)
+            if new_child_id is not None:
+                Studying.objects.filter(lesson_id=new_child_id, passed=False).exclude(
+                    student_id__in=Studying.objects.filter(lesson_id=self.pk).values('student_id')
+                ).update(lesson_id=self.pk, answer='')
+                progress.filter(
+                    current_lesson_id=new_child_id,
+                    student_id__in=Studying.objects.filter(lesson_id=self.pk, passed=False).values('student_id'),
+                ).update(current_lesson_id=self.pk)
+
+    def _detach(self, program):
+        # Links are re-read under the program lock, as this instance may be stale.
+        child_id = None
+        for lesson_id, parent_id in Lesson.objects.filter(
+            models.Q(pk=self.pk) | models.Q(parent_id=self.pk)
+        ).values_list('id', 'parent_id'):
+            if lesson_id == self.pk:
+                self.parent_id = parent_id
+            else:
+                child_id = lesson_id
+
+        # The lesson's own parent link goes first so that its child can take over the parent.
+        Lesson.objects.filter(pk=self.pk).update(parent_id=None)
+        if child_id is not None:
+            Lesson.objects.filter(pk=child_id).update(parent_id=self.parent_id)
+        if program.head_lesson_id == self.pk:
+            program.head_lesson_id = child_id
+        if program.tail_lesson_id == self.pk:
+            program.tail_lesson_id = self.parent_id
+        self.parent_id = None
+        return child_id
+
+    def _attach(self, program, after_id):
+        if after_id is None:
+            child_id = program.head_lesson_id
+        else:
+            child_id = Lesson.objects.filter(parent_id=after_id).values_list('id', flat=True).first()
+        if child_id is not None:
+            Lesson.objects.filter(pk=child_id).update(parent_id=self.pk)
+        Lesson.objects.filter(pk=self.pk).update(parent_id=after_id)
+        self.parent_id = after_id
+        if after_id is None:
+            program.head_lesson_id = self.pk
+        if child_id is None:
+            program.tail_lesson_id = self.pk
+        return child_id
 
 
 class Student(models.Model):
@@ -76,22 +443,399 @@ class Student(models.Model):
     open_programs = models.ManyToManyField(Program, related_name='students', blank=True)
 
 
+class StudyingQuerySet(models.QuerySet):
+    enroll_chunk_size = 500
+    delete_chunk_size = 1000
+
+    def enroll(self, student_ids, program_ids):
+        """Open programs for students and give each student the first lesson of each program.
+
+        Memberships and lessons that already exist are skipped, as are programs without lessons.
+        Runs one INSERT ... SELECT per program and chunk of students, whatever the number of rows.
+        The raw inserts send no ``m2m_changed``, so enrollment counts are kept in step here.
+        """
+        through = Student.open_programs.through
+        quote_name = connections[self.db].ops.quote_name
+        program_ids = list(program_ids)
+        if not program_ids:
+            return
+        with transaction.atomic(using=self.db):
+            added = Counter()
+            for student_chunk in self._chunks(student_ids):
+                for program_id in program_ids:
+                    added[program_id] += self._execute(
+                        f"""
+                        INSERT INTO {quote_name(through._meta.db_table)} (student_id, program_id)
+                        SELECT student.id, %s
+                        FROM {quote_name(Student._meta.db_table)} student
+                        WHERE student.id IN %s AND EXISTS (
+                            SELECT 1 FROM {quote_name(Program._meta.db_table)} program WHERE program.id = %s
+                        ) AND NOT EXISTS (
+                            SELECT 1 FROM {quote_name(through._meta.db_table)} membership
+                            WHERE membership.student_id = student.id AND membership.program_id = %s
+                        )
+                        """,
+                        [program_id, student_chunk, program_id, program_id]
+                    )
+            for program_id, count in added.items():
+                if count:
+                    Program.objects.filter(pk=program_id).update(student_count=models.F('student_count') + count)
+            if any(added.values()):
+                transaction.on_commit(enrollment_cache.invalidate, using=self.db)
+            self.start_programs(student_ids, program_ids)
+
+    def start_programs(self, student_ids, program_ids):
+        """Give students who opened the programs the first lesson of each, skipping existing rows."""
+        through = Student.open_programs.through
+        quote_name = connections[self.db].ops.quote_name
+        program_ids = list(program_ids)
+        if not program_ids:
+            return
+        with transaction.atomic(using=self.db):
+            for program_id in Program.objects.filter(
+                pk__in=program_ids, head_lesson__isnull=True, lessons__isnull=False
+            ).values_list('id', flat=True).distinct():
+                Program.lock_chain(program_id).save_chain()
+
+            for student_chunk in self._chunks(student_ids):
+                self._execute(
+                    f"""
+                    INSERT INTO {quote_name(self.model._meta.db_table)} (student_id, lesson_id, answer, passed)
+                    SELECT membership.student_id, program.head_lesson_id, '', %s
+                    FROM {quote_name(through._meta.db_table)} membership
+                    JOIN {quote_name(Program._meta.db_table)} program ON program.id = membership.program_id
+                    WHERE membership.student_id IN %s AND membership.program_id IN %s
+                        AND program.head_lesson_id IS NOT NULL AND NOT EXISTS (
+                            SELECT 1 FROM {quote_name(self.model._meta.db_table)} studying
+                            WHERE studying.student_id = membership.student_id
+                                AND studying.lesson_id = program.head_lesson_id
+                        )
+                    """,
+                    [False, student_chunk, program_ids]
+                )
+                self._execute(
+                    f"""
+                    INSERT INTO {quote_name(StudentProgress._meta.db_table)}
+                        (student_id, program_id, passed_count, total_lessons, current_lesson_id)
+                    SELECT membership.student_id, program.id, 0, (
+                        SELECT COUNT(*) FROM {quote_name(Lesson._meta.db_table)} lesson
+                        WHERE lesson.program_id = program.id
+                    ), program.head_lesson_id
+                    FROM {quote_name(through._meta.db_table)} membership
+                    JOIN {quote_name(Program._meta.db_table)} program ON program.id = membership.program_id
+                    WHERE membership.student_id IN %s AND membership.program_id IN %s AND NOT EXISTS (
+                        SELECT 1 FROM {quote_name(StudentProgress._meta.db_table)} progress
+                        WHERE progress.student_id = membership.student_id AND progress.program_id = program.id
+                    )
+                    """,
+                    [student_chunk, program_ids]
+                )
+
+    def stop_programs(self, student_ids, program_ids):
+        """Delete the students' progress in the programs they no longer have open, one bounded chunk at a time.
+
+        Rows are removed with plain DELETE statements by primary key, without loading them into
+        Django's delete collector. Run outside a transaction, as the membership signals do after
+        commit, each chunk commits on its own and write locks are only held for a chunk.
+        """
+        through = Student.open_programs.through
+        program_ids = list(program_ids)
+        # Memberships re-opened before the teardown ran keep their progress.
+        still_open = models.Exists(through.objects.filter(
+            student_id=models.OuterRef('student_id'), program_id=models.OuterRef('lesson__program_id')
+        ))
+        for student_chunk in self._chunks(student_ids):
+            rows = self.filter(student_id__in=student_chunk, lesson__program_id__in=program_ids).exclude(still_open)
+            while True:
+                pks = list(rows.values_list('pk', flat=True)[:self.delete_chunk_size])
+                if not pks:
+                    break
+                self.filter(pk__in=pks)._raw_delete(self.db)
+            progress_pks = list(StudentProgress.objects.filter(
+                student_id__in=student_chunk, program_id__in=program_ids
+            ).exclude(models.Exists(through.objects.filter(
+                student_id=models.OuterRef('student_id'), program_id=models.OuterRef('program_id')
+            ))).values_list('pk', flat=True))
+            StudentProgress.objects.filter(pk__in=progress_pks)._raw_delete(self.db)
+
+    def unlock_lesson(self, lesson_id):
+        """Give the lesson to every student who can reach it, returning how many got it.
+
+        That is everyone who passed the lesson before it or, for the first lesson of a program,
+        everyone who opened the program. Runs one INSERT ... SELECT however many students there are.
+        """
+        quote_name = connections[self.db].ops.quote_name
+        table = quote_name(self.model._meta.db_table)
+        lesson = Lesson.objects.filter(pk=lesson_id).values_list('program_id', 'parent_id').first()
+        if lesson is None:
+            return 0
+        program_id, parent_id = lesson
+        if parent_id is None:
+            eligible = f"""
+                SELECT membership.student_id FROM {quote_name(Student.open_programs.through._meta.db_table)} membership
+                WHERE membership.program_id = %s
+            """
+            eligible_params = [program_id]
+        else:
+            eligible = f"""
+                SELECT predecessor.student_id FROM {table} predecessor
+                WHERE predecessor.lesson_id = %s AND predecessor.passed = %s
+            """
+            eligible_params = [parent_id, True]
+        with transaction.atomic(using=self.db):
+            unlocked = self._execute(
+                f"""
+                INSERT INTO {table} (student_id, lesson_id, answer, passed)
+                SELECT eligible.student_id, %s, '', %s
+                FROM ({eligible}) eligible
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM {table} studying
+                    WHERE studying.student_id = eligible.student_id AND studying.lesson_id = %s
+                )
+                """,
+                [lesson_id, False, *eligible_params, lesson_id]
+            )
+            if unlocked:
+                StudentProgress.objects.filter(
+                    program_id=program_id, current_lesson__isnull=True,
+                    student_id__in=self.filter(lesson_id=lesson_id, passed=False).values('student_id'),
+                ).update(current_lesson_id=lesson_id)
+        return unlocked
+
+    def _chunks(self, ids):
+        ids = list(ids)
+        for start in range(0, len(ids), self.enroll_chunk_size):
+            yield ids[start:start + self.enroll_chunk_size]
+
+    def _execute(self, sql, params):
+        # Expands list parameters into "(%s, %s, ...)" placeholders.
+        placeholders, flat_params = [], []
+        for param in params:
+            if isinstance(param, list):
+                placeholders.append('(' + ', '.join(['%s'] * len(param)) + ')')
+                flat_params.extend(param)
+            else:
+                placeholders.append('%s')
+                flat_params.append(param)
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql % tuple(placeholders), flat_params)
+            return cursor.rowcount
+
+
+    def submit_batch(self, student_id, answers):
+        """Grade many answers of one student in order, unlocking chained lessons as they pass.
+
+        ``answers`` holds dicts with ``answer`` and either ``studying_id`` or ``lesson_id``; the latter
+        can address lessons unlocked earlier in the same batch. Returns one result dict per answer.
+        """
+        with transaction.atomic():
+            # Passed rows are loaded too: they answer "not available", and a passed child row must
+            # not be shadowed by an unsaved one when its parent passes in this batch.
+            rows = {
+                row.lesson_id: row
+                for row in self.filter(student_id=student_id).filter(
+                    models.Q(pk__in=[item['studying_id'] for item in answers if 'studying_id' in item])
+                    | models.Q(lesson_id__in=[item['lesson_id'] for item in answers if 'lesson_id' in item])
+                )
+            }
+            row_lessons = {row.pk: lesson_id for lesson_id, row in rows.items()}
+            lessons = {
+                lesson_id: (right_answer, child_id, program_id)
+                for lesson_id, right_answer, child_id, program_id in Lesson.objects.filter(
+                    pk__in=set(rows) | {item['lesson_id'] for item in answers if 'lesson_id' in item}
+                ).values_list('id', 'answer', 'child__id', 'program_id')
+            }
+            child_ids = {child_id for _, child_id, _ in lessons.values() if child_id is not None} - set(rows)
+            if child_ids:
+                rows.update((row.lesson_id, row) for row in self.filter(student_id=student_id, lesson_id__in=child_ids))
+
+            results, changed, unlocked, passes = [], {}, {}, {}
+            for item in answers:
+                lesson_id = row_lessons.get(item['studying_id']) if 'studying_id' in item else item['lesson_id']
+                row = rows.get(lesson_id) or unlocked.get(lesson_id)
+                if row is None or row.passed:
+                    results.append({**item, 'error': 'Lesson is not available.'})
+                    continue
+
+                right_answer, child_id, program_id = lessons[lesson_id]
+                row.answer = item['answer']
+                row.passed = str(item['answer']).lower() == right_answer
+                if row.pk is not None:
+                    changed[row.pk] = row
+                passed_count, current_lesson_id = passes.get(program_id, (0, None))
+                if row.passed:
+                    passed_count, current_lesson_id = passed_count + 1, child_id
+                passes[program_id] = (passed_count, current_lesson_id)
+                if row.passed and child_id is not None and child_id not in rows and child_id not in unlocked:
+                    unlocked[child_id] = Studying(student_id=student_id, lesson_id=child_id)
+                results.append({'lesson': lesson_id, 'studying_id': row.pk, 'passed': row.passed})
+
+            self.bulk_update(changed.values(), ['answer', 'passed'])
+            if unlocked:
+                self.bulk_create(unlocked.values(), ignore_conflicts=True)
+                unlocked_ids = dict(
+                    self.filter(student_id=student_id, lesson_id__in=unlocked).values_list('lesson_id', 'id')
+                )
+                for result in results:
+                    if 'error' not in result and result['studying_id'] is None:
+                        result['studying_id'] = unlocked_ids.get(result['lesson'])
+            for program_id, (passed_count, current_lesson_id) in passes.items():
+                if passed_count:
+                    StudentProgress.objects.record_passes(student_id, program_id, current_lesson_id, passed_count)
+                else:
+                    StudentProgress.objects.touch(student_id, program_id)
+        return results
+
+
 class Studying(models.Model):
     lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE, related_name='studying')
     student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='studying')
     answer = models.CharField(max_length=150)
     passed = models.BooleanField(default=False)
 
+    objects = StudyingQuerySet.as_manager()
+
+    def submit(self, answer):
+        """Grade an answer and unlock the next lesson in one transaction with a fixed query count."""
+        # Grading inside the UPDATE makes the write come first, so SQLite takes its write lock up front.
+        is_right = models.Exists(Lesson.objects.filter(pk=models.OuterRef('lesson_id'), answer=str(answer).lower()))
+        # Passed rows stay passed, so the progress counters only ever see a row flip once.
+        with transaction.atomic():
+            flipped = Studying.objects.filter(pk=self.pk, passed=False).update(answer=answer, passed=is_right)
+            if flipped:
+                self.answer = answer
+            self.passed, child_id, program_id = Studying.objects.filter(pk=self.pk).values_list(
+                'passed', 'lesson__child__id', 'lesson__program_id'
+            ).get()
+            if flipped and self.passed:
+                if child_id is not None:
+                    Studying.objects.bulk_create(
+                        [Studying(lesson_id=child_id, student_id=self.student_id)], ignore_conflicts=True
+                    )
+                StudentProgress.objects.record_passes(self.student_id, program_id, child_id)
+            elif flipped:
+                StudentProgress.objects.touch(self.student_id, program_id)
+
     def save(self, *args, **kwargs):
         right_answer = self.lesson.answer
         self.passed = bool(str(self.answer).lower() == right_answer)
-        if self.passed and hasattr(self.lesson, 'child'):
-            Studying.objects.get_or_create(lesson=self.lesson.child, student=self.student)
-        super(Studying, self).save(*args, **kwargs)
+        adding = self._state.adding
+        was_passed = not adding and Studying.objects.filter(pk=self.pk, passed=True).exists()
+        # Writing the row first makes SQLite take its write lock before any read in the transaction.
+        with transaction.atomic():
+            super(Studying, self).save(*args, **kwargs)
+            if self.passed and hasattr(self.lesson, 'child'):
+                Studying.objects.get_or_create(lesson=self.lesson.child, student=self.student)
+            if self.passed != was_passed:
+                child = getattr(self.lesson, 'child', None)
+                if self.passed:
+                    current_lesson_id, count = child.pk if child else None, 1
+                else:
+                    current_lesson_id, count = self.lesson_id, -1
+                StudentProgress.objects.record_passes(
+                    self.student_id, self.lesson.program_id, current_lesson_id, count
+                )
+            elif not adding:
+                StudentProgress.objects.touch(self.student_id, self.lesson.program_id)
 
     class Meta:
         unique_together = ['lesson', 'student']
 
 
+class StudentProgressQuerySet(models.QuerySet):
+    rebuild_batch_size = 1000
+
+    def record_passes(self, student_id, program_id, current_lesson_id, count=1):
+        """Add ``count`` passed lessons to a student's progress in a program in one UPDATE."""
+        return self.filter(student_id=student_id, program_id=program_id).update(
+            passed_count=models.F('passed_count') + count,
+            current_lesson_id=current_lesson_id,
+            last_activity=timezone.now(),
+        )
+
+    def touch(self, student_id, program_id):
+        """Record an answer that did not change the passed count."""
+        return self.filter(student_id=student_id, program_id=program_id).update(last_activity=timezone.now())
+
+    def rebuild(self, batch_size=None):
+        """Recompute every row from memberships, lessons and Studying rows, returning the number of rows.
+
+        Students are rebuilt about ``batch_size`` memberships at a time, so memory stays bounded by
+        the batch. The last activity of rows that already existed is kept, as Studying rows carry no
+        timestamps.
+        """
+        batch_size = batch_size or self.rebuild_batch_size
+        through = Student.open_programs.through
+        rebuilt = 0
+        with transaction.atomic(using=self.db):
+            totals = dict(
+                Lesson.objects.values_list('program_id').annotate(total=models.Count('id')).order_by()
+            )
+            self.exclude(student_id__in=through.objects.values('student_id'))._raw_delete(self.db)
+
+            memberships = through.objects.values_list('student_id', 'program_id').order_by('student_id', 'program_id')
+            batch = []
+            for _, pairs in groupby(memberships.iterator(chunk_size=batch_size), key=itemgetter(0)):
+                # A student's memberships never span two batches, as each batch replaces whole students.
+                batch.extend(pairs)
+                if len(batch) >= batch_size:
+                    rebuilt += self._rebuild_batch(batch, totals)
+                    batch = []
+            if batch:
+                rebuilt += self._rebuild_batch(batch, totals)
+        return rebuilt
+
+    def _rebuild_batch(self, memberships, totals):
+        student_ids = {student_id for student_id, _ in memberships}
+        studying = Studying.objects.filter(student_id__in=student_ids)
+        passed_counts = dict(
+            ((student_id, program_id), passed_count)
+            for student_id, program_id, passed_count in studying.filter(passed=True).values_list(
+                'student_id', 'lesson__program_id'
+            ).annotate(passed_count=models.Count('id')).order_by()
+        )
+        # The current lesson is the one a student is waiting on: not passed yet, with the lesson
+        # before it in the chain passed. Lesson ids say nothing about the order of the chain.
+        current_lessons = {}
+        for student_id, program_id, lesson_id in studying.filter(passed=False).filter(
+            models.Q(lesson__parent__isnull=True) | models.Exists(Studying.objects.filter(
+                student_id=models.OuterRef('student_id'), lesson_id=models.OuterRef('lesson__parent_id'), passed=True
+            ))
+        ).values_list('student_id', 'lesson__program_id', 'lesson_id').order_by('lesson_id'):
+            current_lessons.setdefault((student_id, program_id), lesson_id)
+        activity = dict(
+            ((student_id, program_id), last_activity)
+            for student_id, program_id, last_activity in self.filter(
+                student_id__in=student_ids, last_activity__isnull=False
+            ).values_list('student_id', 'program_id', 'last_activity')
+        )
+
+        self.filter(student_id__in=student_ids)._raw_delete(self.db)
+        self.bulk_create(StudentProgress(
+            student_id=student_id,
+            program_id=program_id,
+            passed_count=passed_counts.get((student_id, program_id), 0),
+            total_lessons=totals.get(program_id, 0),
+            current_lesson_id=current_lessons.get((student_id, program_id)),
+            last_activity=activity.get((student_id, program_id)),
+        ) for student_id, program_id in memberships)
+        return len(memberships)
+
+
+class StudentProgress(models.Model):
+    """Per student and program summary of ``Studying`` rows, kept up to date as lessons are passed."""
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='progress')
+    program = models.ForeignKey(Program, on_delete=models.CASCADE, related_name='progress')
+    passed_count = models.PositiveIntegerField(default=0)
+    total_lessons = models.PositiveIntegerField(default=0)
+    current_lesson = models.ForeignKey(Lesson, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_activity = models.DateTimeField(null=True, blank=True)
+
+    objects = StudentProgressQuerySet.as_manager()
+
+    class Meta:
+        unique_together = ['student', 'program']
+
+
 
 
@@ -0,0 +1,56 @@
+from rest_framework import pagination
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(pagination.BasePagination):
+    """Keyset pagination over the primary key, newest first.
+
+    The response body stays a plain list; the next page is advertised in a ``Link`` header,
+    so each page costs one indexed range scan no matter how deep into the history it is.
+    """
+    cursor_query_param = 'cursor'
+    limit_query_param = 'limit'
+    default_limit = 50
+    max_limit = 500
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        limit = self.get_integer_param(request, self.limit_query_param, self.default_limit)
+        limit = min(limit, self.max_limit)
+        cursor = self.get_integer_param(request, self.cursor_query_param, None)
+
+        queryset = queryset.order_by('-pk')
+        if cursor is not None:
+            queryset = queryset.filter(pk__lt=cursor)
+
+        page = list(queryset[:limit + 1])
+        self.next_cursor = page[limit - 1].pk if len(page) > limit else None
+        return page[:limit]
+
+    def get_paginated_response(self, data):
+        headers = {}
+        next_link = self.get_next_link()
+        if next_link is not None:
+            headers['Link'] = f'<{next_link}>; rel="next"'
+        return Response(data, headers=headers)
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    @staticmethod
+    def get_integer_param(request, name, default):
+        value = request.query_params.get(name)
+        if value is None:
+            return default
+        try:
+            value = int(value)
+        except ValueError:
+            value = 0
+        if value < 1:
+            raise ValidationError({name: 'A positive integer is required.'})
+        return value
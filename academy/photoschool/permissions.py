@@ -1,40 +1,74 @@
+"""Permission classes sharing one resolved principal per request.
+
+Query budget per request, whatever the number of objects checked:
+
+* ``IsStaffPermission``, ``IsManagerOrSuperUserPermission``, ``IsSuperUserPermission``: none
+  beyond authentication, the role flags live on the user row.
+* ``IsStudyingOwnerPermission``: one query for the student id, shared with the views through
+  ``get_principal``; object checks compare ids and cost nothing.
+"""
+from django.utils.functional import cached_property
 from rest_framework import permissions
 
+from .models import Student
+
+
+class Principal:
+    """Who is making the request: role flags and, loaded on first use, the student id."""
+
+    def __init__(self, user):
+        self.user_id = user.pk
+        self.is_superuser = bool(getattr(user, 'is_superuser', False))
+        self.is_editor = bool(getattr(user, 'is_editor', False))
+        self.is_manager = bool(getattr(user, 'is_manager', False))
+        self._user = user
+
+    @cached_property
+    def student_id(self):
+        if self.user_id is None:
+            return None
+        student = self._user._state.fields_cache.get('student')
+        if student is not None:
+            return student.pk
+        return Student.objects.filter(user_id=self.user_id).values_list('id', flat=True).first()
+
+    @property
+    def is_staff(self):
+        return self.is_editor or self.is_manager or self.is_superuser
+
+
+def get_principal(request):
+    """Return the principal of the request, resolving it only once per request."""
+    principal = getattr(request, '_photoschool_principal', None)
+    if principal is None or principal.user_id != request.user.pk:
+        principal = request._photoschool_principal = Principal(request.user)
+    return principal
+
 
 class IsStudyingOwnerPermission(permissions.BasePermission):
 
     def has_permission(self, request, view):
-        user = request.user
-        return bool(user and hasattr(user, 'student'))
+        return get_principal(request).student_id is not None
 
     def has_object_permission(self, request, view, obj):
-        return self.has_permission(request, view) and obj.student.user == request.user
+        student_id = get_principal(request).student_id
+        return student_id is not None and obj.student_id == student_id
 
 
 class IsStaffPermission(permissions.BasePermission):
 
     def has_permission(self, request, view):
-        user = request.user
-        return bool(
-            user and bool(
-                user.is_editor or user.is_manager or user.is_superuser
-            )
-        )
+        return get_principal(request).is_staff
 
 
 class IsManagerOrSuperUserPermission(permissions.BasePermission):
 
     def has_permission(self, request, view):
-        user = request.user
-        return bool(
-            user and bool(
-                user.is_manager or user.is_superuser
-            )
-        )
+        principal = get_principal(request)
+        return principal.is_manager or principal.is_superuser
 
 
 class IsSuperUserPermission(permissions.BasePermission):
 
     def has_permission(self, request, view):
-        user = request.user
-        return bool(user and user.is_superuser)
+        return get_principal(request).is_superuser
@@ -0,0 +1,48 @@
+"""JSON renderer and parser backed by ``orjson`` when it is installed.
+
+Both fall back to DRF's stock ``json`` implementations when ``orjson`` is missing, and the
+renderer also when indented output is requested or ``orjson`` rejects a value, so they can
+always be listed in settings. Rendered bytes match ``JSONRenderer``: dates, decimals and other non-native values still go
+through DRF's encoder.
+"""
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    # DRF writes datetimes with millisecond precision and a ``Z`` suffix; orjson would not.
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+
+class ORJSONRenderer(JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=JSONEncoder().default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            # Values orjson rejects outright, such as integers wider than 64 bits.
+            return super().render(data, accepted_media_type, renderer_context)
+        # Escaped by JSONRenderer as well, they are not valid in JavaScript string literals.
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class ORJSONParser(JSONParser):
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 
+from .fieldsets import SparseFieldsetMixin
 from .models import *
 
 
@@ -10,11 +11,11 @@ class ProgramSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Program
-        fields = '__all__'
+        exclude = ('head_lesson', 'tail_lesson', 'student_count', 'wish_count', 'content_generation')
 
 
 class ProgramShortSerializer(serializers.ModelSerializer):
-    student_amount = serializers.IntegerField(read_only=True)
+    student_amount = serializers.IntegerField(source='student_count', read_only=True)
 
     class Meta:
         model = Program
@@ -50,7 +51,7 @@ class ThemeCRUDSerializer(serializers.ModelSerializer):
 # ----------------------------------------------------------------------------------------------------------------------
 # _____________________________________________________Lesson Block_____________________________________________________
 # ----------------------------------------------------------------------------------------------------------------------
-class LessonSerializer(serializers.ModelSerializer):
+class LessonSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Lesson
@@ -73,6 +74,9 @@ class LessonMicroSerializer(serializers.ModelSerializer):
 
 
 class LessonCRUDSerializer(serializers.ModelSerializer):
+    after = serializers.PrimaryKeyRelatedField(
+        queryset=Lesson.objects.all(), allow_null=True, required=False, write_only=True
+    )
 
     class Meta:
         model = Lesson
@@ -80,10 +84,24 @@ class LessonCRUDSerializer(serializers.ModelSerializer):
         exclude = ('is_approved',)
 
 
+class LessonMoveSerializer(serializers.Serializer):
+    after = serializers.PrimaryKeyRelatedField(queryset=Lesson.objects.all(), allow_null=True)
+
+
+class LessonImportSerializer(serializers.Serializer):
+    title = serializers.CharField(max_length=100)
+    theory = serializers.CharField(max_length=2000)
+    practice = serializers.CharField(max_length=150)
+    answer = serializers.CharField(max_length=150)
+    theme = serializers.IntegerField(required=False, allow_null=True)
+
+
 class LessonThemeSerializer(serializers.ModelSerializer):
     lessons = serializers.SerializerMethodField()
 
     def get_lessons(self, obj):
+        if 'lessons' in self.context:
+            return self.context['lessons'][obj.pk]
         actual_lessons = []
         for lesson in obj.lessons.all():
             actual_lessons.append(lesson.actual_version)
@@ -94,6 +112,18 @@ class LessonThemeSerializer(serializers.ModelSerializer):
         fields = ('id', 'program', 'title', 'lessons')
 
 
+# ----------------------------------------------------------------------------------------------------------------------
+# ____________________________________________________Version Block____________________________________________________
+# ----------------------------------------------------------------------------------------------------------------------
+class VersionApproveSerializer(serializers.Serializer):
+    version_id = serializers.IntegerField()
+    approved = serializers.BooleanField()
+
+
+class VersionBulkApproveSerializer(serializers.Serializer):
+    versions = VersionApproveSerializer(many=True, allow_empty=False)
+
+
 # ----------------------------------------------------------------------------------------------------------------------
 # ____________________________________________________Student Block____________________________________________________
 # ----------------------------------------------------------------------------------------------------------------------
@@ -120,18 +150,40 @@ class StudentAccessSerializer(serializers.ModelSerializer):
         read_only_fields = ('user', 'wish_programs')
 
 
-class StudyingSerializer(serializers.ModelSerializer):
+class StudyingSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     actual_lesson = serializers.SerializerMethodField()
 
     def get_actual_lesson(self, obj):
-        return obj.lesson.actual_version
+        return self.fieldset.filter_dict('actual_lesson', obj.lesson.actual_version)
 
     class Meta:
         model = Studying
-        read_only_fields = ('id', 'passed', 'student', 'actual_lesson', 'program')
+        read_only_fields = ('id', 'passed', 'student', 'actual_lesson', 'program', 'lesson')
         fields = '__all__'
 
 
+class StudyingAnswerSerializer(serializers.Serializer):
+    studying_id = serializers.IntegerField(required=False)
+    lesson_id = serializers.IntegerField(required=False)
+    answer = serializers.CharField(max_length=150, allow_blank=True)
+
+    def validate(self, attrs):
+        if ('studying_id' in attrs) == ('lesson_id' in attrs):
+            raise serializers.ValidationError('Either studying_id or lesson_id is required.')
+        return attrs
+
+
+class StudyingBatchSerializer(serializers.Serializer):
+    max_answers = 500
+
+    answers = StudyingAnswerSerializer(many=True, allow_empty=False)
+
+    def validate_answers(self, answers):
+        if len(answers) > self.max_answers:
+            raise serializers.ValidationError(f'No more than {self.max_answers} answers per request.')
+        return answers
+
+
 class StudentLessonsPassedSerializer(serializers.ModelSerializer):
     amount_passed_lesson = serializers.IntegerField(read_only=True)
 
@@ -146,4 +198,4 @@ class ProgramListSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Program
-        fields = '__all__'
+        exclude = ('head_lesson', 'tail_lesson', 'student_count', 'wish_count', 'content_generation')
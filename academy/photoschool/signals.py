@@ -1,17 +1,153 @@
-from django.db.models.signals import m2m_changed
+from functools import partial
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
 from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from reversion.models import Version
+from reversion.signals import post_revision_commit
 
-from .models import Student, Studying, Program
+from .cache import enrollment_cache, token_cache, version_cache
+from .models import Student, Studying, Program, Theme, Lesson, PublishedVersion
+from .tasks import run_after_commit
 
 
 @receiver(m2m_changed, sender=Student.open_programs.through)
-def create_studying(sender, action, instance, pk_set, **kwargs):
+def create_studying(sender, action, instance, pk_set, reverse, **kwargs):
 
     if action == "post_add":
-        new_studying = []
-
-        for program in Program.objects.filter(pk__in=pk_set):
-            new_studying.append(Studying(student=instance, lesson=program.first_lesson))
-        Studying.objects.bulk_create(new_studying)
+        if reverse:
+            Studying.objects.start_programs(pk_set, [instance.pk])
+        else:
+            Studying.objects.start_programs([instance.pk], pk_set)
+    # Teardown runs after commit: m2m signals are sent inside the membership write's transaction,
+    # which would otherwise hold every chunk of deletes until the end.
     elif action == "post_remove":
-        Studying.objects.filter(lesson__program__in=pk_set).delete()
+        if reverse:
+            run_after_commit(Studying.objects.stop_programs, list(pk_set), [instance.pk])
+        else:
+            run_after_commit(Studying.objects.stop_programs, [instance.pk], list(pk_set))
+    elif action == "pre_clear":
+        if reverse:
+            student_ids = list(instance.students.values_list('id', flat=True))
+            run_after_commit(Studying.objects.stop_programs, student_ids, [instance.pk])
+        else:
+            program_ids = list(instance.open_programs.values_list('id', flat=True))
+            run_after_commit(Studying.objects.stop_programs, [instance.pk], program_ids)
+
+
+@receiver(m2m_changed, sender=Student.open_programs.through)
+@receiver(m2m_changed, sender=Student.wish_programs.through)
+def count_memberships(sender, action, instance, pk_set, reverse, **kwargs):
+    field = 'student_count' if sender is Student.open_programs.through else 'wish_count'
+
+    # Django only reports the rows actually added, but every requested row on removal.
+    if action == "post_add":
+        if reverse:
+            _shift_count(field, [instance.pk], len(pk_set))
+        else:
+            _shift_count(field, pk_set, 1)
+    elif action == "pre_remove":
+        if reverse:
+            removed = sender.objects.filter(program_id=instance.pk, student_id__in=pk_set).count()
+            _shift_count(field, [instance.pk], -removed)
+        else:
+            memberships = sender.objects.filter(student_id=instance.pk, program_id__in=pk_set)
+            _shift_count(field, memberships.values('program_id'), -1)
+    elif action == "pre_clear":
+        if reverse:
+            Program.objects.filter(pk=instance.pk).update(**{field: 0})
+            transaction.on_commit(enrollment_cache.invalidate)
+        else:
+            _shift_count(field, sender.objects.filter(student_id=instance.pk).values('program_id'), -1)
+
+
+@receiver(pre_delete, sender=Student)
+def uncount_deleted_student(sender, instance, **kwargs):
+    # Membership rows go with the student without any m2m_changed signal.
+    for field, through in Program.counted_memberships().items():
+        _shift_count(field, through.objects.filter(student_id=instance.pk).values('program_id'), -1)
+
+
+def _shift_count(field, program_ids, delta):
+    if delta:
+        Program.objects.filter(pk__in=program_ids).update(**{field: F(field) + delta})
+        transaction.on_commit(enrollment_cache.invalidate)
+
+
+@receiver(post_save, sender=Program)
+@receiver(post_delete, sender=Program)
+def invalidate_enrollment_cache(sender, **kwargs):
+    # Cached enrollment lists carry program titles too.
+    transaction.on_commit(enrollment_cache.invalidate)
+
+
+@receiver(post_save, sender=Lesson)
+def unlock_saved_lesson(sender, instance, created, **kwargs):
+    # Students who passed the previous lesson before this one existed or was approved.
+    if created or instance.is_approved:
+        run_after_commit(Studying.objects.unlock_lesson, instance.pk)
+
+
+@receiver(post_save, sender=Program)
+@receiver(post_save, sender=Theme)
+@receiver(post_delete, sender=Theme)
+@receiver(post_save, sender=Lesson)
+def bump_content_generation(sender, instance, created=False, **kwargs):
+    # New lessons move the generation together with the chain pointers.
+    if sender is Lesson and created:
+        return
+    Program.bump_generation(instance.pk if sender is Program else instance.program_id)
+
+
+@receiver(post_save, sender=PublishedVersion)
+@receiver(post_delete, sender=PublishedVersion)
+def bump_published_generation(sender, instance, **kwargs):
+    if instance.is_marker:
+        return
+    if ContentType.objects.get_for_id(instance.content_type_id).model_class() is Program:
+        Program.bump_generation(instance.object_id)
+    else:
+        Program.bump_generation(instance.field_dict.get('program_id'))
+
+
+@receiver(post_revision_commit)
+def publish_approved_versions(sender, revision, versions, **kwargs):
+    for version in versions:
+        if version.field_dict.get('is_approved'):
+            PublishedVersion.objects.publish(version)
+
+
+@receiver(post_delete, sender=Program)
+@receiver(post_delete, sender=Theme)
+@receiver(post_delete, sender=Lesson)
+def delete_published_version(sender, instance, **kwargs):
+    PublishedVersion.objects.filter(
+        content_type=ContentType.objects.get_for_model(sender), object_id=str(instance.pk)
+    ).delete()
+
+
+@receiver(post_delete, sender=Version)
+def evict_cached_version(sender, instance, **kwargs):
+    version_cache.delete(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def evict_deleted_token(sender, instance, **kwargs):
+    # Again on commit, in case a concurrent request cached the token before the delete was visible.
+    token_cache.revoke(instance.key)
+    transaction.on_commit(partial(token_cache.revoke, instance.key))
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def evict_saved_user_tokens(sender, instance, created, update_fields=None, **kwargs):
+    # Role flags and is_active are read from the cached user, so they must not outlive a change.
+    if created or update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    keys = list(Token.objects.filter(user_id=instance.pk).values_list('key', flat=True))
+    if keys:
+        token_cache.revoke(*keys)
+        transaction.on_commit(partial(token_cache.revoke, *keys))
@@ -0,0 +1,78 @@
+"""Work deferred until the surrounding transaction commits and then run off the request thread.
+
+Tasks run one at a time, in order, on a background worker thread with its own database connection.
+A task failing with an ``OperationalError``, such as SQLite's "database is locked" while a request
+holds the write lock, is retried with a growing delay before it is logged and dropped.
+"""
+import logging
+import time
+from queue import Queue
+from threading import Lock, Thread
+
+from django.conf import settings
+from django.db import OperationalError, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_queue = Queue()
+_worker = None
+_worker_lock = Lock()
+
+
+def run_after_commit(function, *args):
+    """Call ``function(*args)`` on the worker thread once the current transaction commits.
+
+    With ``PHOTOSCHOOL_TASKS_EAGER`` set, as in tests, the call happens in the committing thread instead.
+    """
+    transaction.on_commit(lambda: _dispatch(function, args))
+
+
+def wait():
+    """Block until every queued task has run."""
+    _queue.join()
+
+
+def _dispatch(function, args):
+    if getattr(settings, 'PHOTOSCHOOL_TASKS_EAGER', False):
+        function(*args)
+        return
+    _start_worker()
+    _queue.put((function, args))
+
+
+def _start_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = Thread(target=_work, name='photoschool-tasks', daemon=True)
+            _worker.start()
+
+
+def _work():
+    while True:
+        function, args = _queue.get()
+        try:
+            _run(function, args)
+        finally:
+            _queue.task_done()
+
+
+def _run(function, args):
+    retries = getattr(settings, 'PHOTOSCHOOL_TASK_RETRIES', 5)
+    delay = getattr(settings, 'PHOTOSCHOOL_TASK_RETRY_DELAY', 0.1)
+    for attempt in range(retries + 1):
+        try:
+            function(*args)
+            return
+        except OperationalError:
+            if attempt == retries:
+                logger.exception('Background task %s failed after %s attempts.', function.__name__, attempt + 1)
+                return
+            logger.warning('Background task %s failed, retrying.', function.__name__, exc_info=True)
+        except Exception:
+            logger.exception('Background task %s failed.', function.__name__)
+            return
+        finally:
+            # A fresh connection for the next attempt, and none left open between tasks.
+            connections.close_all()
+        time.sleep(delay * 2 ** attempt)
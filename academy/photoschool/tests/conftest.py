@@ -1,9 +1,11 @@
 import pytest
 from django.contrib.auth import get_user_model
+from django.core.cache import caches
 
 from model_bakery import baker
 from rest_framework.test import APIClient
 
+from photoschool.cache import namespaces
 from photoschool.models import Student, Program, Theme, Lesson, Studying
 
 User = get_user_model()
@@ -17,6 +19,25 @@ def django_db_setup(django_db_setup, django_db_blocker):
         )
 
 
+@pytest.fixture(autouse=True)
+def photoschool_cache(settings):
+    # A local stand-in for the shared tier, emptied for every test: test transactions are
+    # rolled back, so ids and generations repeat between tests.
+    settings.CACHES = {
+        **settings.CACHES,
+        'photoschool': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'photoschool-tests'},
+    }
+    caches['photoschool'].clear()
+    for cache in namespaces.values():
+        cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def eager_tasks(settings):
+    # Background tasks run in the test's thread, inside its transaction.
+    settings.PHOTOSCHOOL_TASKS_EAGER = True
+
+
 @pytest.fixture
 def api_client():
     return APIClient()
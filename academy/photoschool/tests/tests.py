@@ -51,7 +51,7 @@ def test_add_student(api_client, student_user2, program_photo):
 # @pytest.mark.skip
 def test_create_studying_signal(
     api_client, student, student_user, manager_user, program_photo,
-    lesson_pixelmator, studying_signal, 
+    lesson_pixelmator, studying_signal, django_capture_on_commit_callbacks
 ):
     from photoschool.models import Studying
     api_client.force_login(manager_user)
@@ -66,9 +66,10 @@ def test_create_studying_signal(
 
     assert studying_count + 1 == Studying.objects.count()
 
-    resp = api_client.patch(f'/api/v1/student-access/{student.id}/', {
-        "open_programs": []
-    }, format="json")
+    with django_capture_on_commit_callbacks(execute=True):
+        resp = api_client.patch(f'/api/v1/student-access/{student.id}/', {
+            "open_programs": []
+        }, format="json")
 
     assert resp.status_code == status.HTTP_200_OK
 
@@ -1159,6 +1160,562 @@ def test_available_lessons(
     ]
 
 
+def test_published_version_snapshot(program_photo, editor_user, django_assert_num_queries):
+    from photoschool.models import PublishedVersion
+
+    for title in ('Photo v1', 'Photo v2'):
+        program_photo.title = title
+        program_photo.is_approved = True
+        with reversion.create_revision():
+            reversion.set_user(editor_user)
+            program_photo.save()
+
+    program_photo.title = 'Photo draft'
+    program_photo.is_approved = False
+    with reversion.create_revision():
+        reversion.set_user(editor_user)
+        program_photo.save()
+
+    assert PublishedVersion.objects.count() == 1
+
+    with django_assert_num_queries(1):
+        actual_version = program_photo.actual_version
+
+    assert actual_version['title'] == 'Photo v2'
+    assert actual_version['editor'] == editor_user.username
+
+    program_photo.published_version.version.delete()
+
+    assert PublishedVersion.objects.count() == 0
+    assert program_photo.actual_version['title'] == 'Photo v1'
+    assert PublishedVersion.objects.count() == 1
+
+
+def test_with_published_versions(program_photo, editor_user, django_assert_num_queries):
+    for number in range(5):
+        with reversion.create_revision():
+            reversion.set_user(editor_user)
+            baker.make(
+                Lesson, is_approved=True, program=program_photo, editor=editor_user, title=f'Lesson {number}'
+            )
+
+    with django_assert_num_queries(2):
+        titles = [lesson.actual_version['title'] for lesson in Lesson.objects.with_published_versions()]
+
+    assert titles == [f'Lesson {number}' for number in range(5)]
+
+
+def test_version_cache(program_photo, editor_user, django_assert_num_queries):
+    from photoschool.cache import version_cache
+
+    with reversion.create_revision():
+        reversion.set_user(editor_user)
+        program_photo.save()
+    version = Version.objects.get_for_object(program_photo).get()
+
+    with django_assert_num_queries(1):
+        field_dict = version_cache.field_dict(version.id)
+
+    field_dict['title'] = 'Changed'
+
+    with django_assert_num_queries(0):
+        assert version_cache.field_dict(version.id) == {
+            'id': program_photo.id,
+            'title': 'Photo',
+            'description': 'About photo',
+            'is_approved': True,
+            'editor': editor_user.username
+        }
+
+    version.delete()
+
+    assert len(version_cache.cache.local) == 0
+
+
+def test_lru_cache_eviction():
+    from photoschool.cache import LRUCache
+
+    cache = LRUCache(max_size=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+
+
+def test_program_history_pagination(api_client, editor_user, manager_user, program_photo):
+    for title, is_approved in (('v1', True), ('v2', False), ('v3', True), ('v4', True)):
+        program_photo.title = title
+        program_photo.is_approved = is_approved
+        with reversion.create_revision():
+            reversion.set_user(editor_user)
+            program_photo.save()
+
+    api_client.force_login(manager_user)
+
+    resp = api_client.get(f'/api/v1/program-history/{program_photo.pk}/', {'limit': 2})
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert [item['title'] for item in resp.data] == ['v4', 'v3']
+    next_link = resp['Link'].split(';')[0].strip('<>')
+
+    resp = api_client.get(next_link)
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert [item['title'] for item in resp.data] == ['v1']
+    assert not resp.has_header('Link')
+
+    resp = api_client.get(f'/api/v1/program-history/{program_photo.pk}/', {'limit': 0})
+
+    assert resp.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_versions_bulk_approve(
+        api_client, editor_user, manager_user, program_photo, lesson_not_approve, theme_not_approve
+):
+    from reversion.models import Revision
+
+    lesson_not_approve.title = 'Lesson v1'
+    with reversion.create_revision():
+        reversion.set_user(editor_user)
+        lesson_not_approve.save()
+    lesson_version = Version.objects.get_for_object(lesson_not_approve).get()
+
+    theme_not_approve.title = 'Theme v1'
+    with reversion.create_revision():
+        reversion.set_user(editor_user)
+        theme_not_approve.save()
+    theme_version = Version.objects.get_for_object(theme_not_approve).get()
+
+    program_photo.title = 'Photo v1'
+    with reversion.create_revision():
+        reversion.set_user(editor_user)
+        program_photo.save()
+    program_version = Version.objects.get_for_object(program_photo).get()
+
+    revision_count = Revision.objects.count()
+    api_client.force_login(manager_user)
+
+    resp = api_client.put('/api/v1/versions-approve/', {
+        'versions': [
+            {'version_id': lesson_version.id, 'approved': True},
+            {'version_id': theme_version.id, 'approved': True},
+            {'version_id': program_version.id, 'approved': False},
+        ]
+    }, format='json')
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert resp.data == {
+        'approved': [lesson_version.id, theme_version.id], 'rejected': [program_version.id], 'skipped': []
+    }
+
+    lesson_not_approve.refresh_from_db()
+    theme_not_approve.refresh_from_db()
+    assert lesson_not_approve.is_approved
+    assert theme_not_approve.is_approved
+    assert not Version.objects.filter(pk=program_version.id).exists()
+    assert Revision.objects.count() == revision_count + 1
+    assert lesson_not_approve.actual_version['title'] == 'Lesson v1'
+
+    resp = api_client.put('/api/v1/versions-approve/', {
+        'versions': [{'version_id': program_version.id, 'approved': True}]
+    }, format='json')
+
+    assert resp.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_versions_bulk_approve_conflicts(
+        api_client, editor_user, manager_user, program_photo, lesson_not_approve, theme_not_approve,
+        django_capture_on_commit_callbacks
+):
+    def save_version(obj, title):
+        obj.title = title
+        with reversion.create_revision():
+            reversion.set_user(editor_user)
+            obj.save()
+        return Version.objects.get_for_object(obj).first()
+
+    lesson_versions = [save_version(lesson_not_approve, f'Lesson v{number}') for number in (1, 2)]
+    theme_version = save_version(theme_not_approve, 'Theme v1')
+    program_version = save_version(program_photo, 'Photo v1')
+    Program.objects.filter(pk=program_photo.pk).update(title='Photo')
+    api_client.force_login(manager_user)
+
+    resp = api_client.put('/api/v1/versions-approve/', {'versions': [
+        {'version_id': version.id, 'approved': True} for version in lesson_versions
+    ]}, format='json')
+
+    assert resp.status_code == status.HTTP_400_BAD_REQUEST
+    lesson_not_approve.refresh_from_db()
+    assert not lesson_not_approve.is_approved
+
+    assert api_client.get('/api/v1/program-students-amount/').data[0]['title'] == 'Photo'
+    theme_not_approve.delete()
+    with django_capture_on_commit_callbacks(execute=True):
+        resp = api_client.put('/api/v1/versions-approve/', {'versions': [
+            {'version_id': theme_version.id, 'approved': True},
+            {'version_id': program_version.id, 'approved': True},
+        ]}, format='json')
+
+    assert resp.data == {'approved': [program_version.id], 'rejected': [], 'skipped': [theme_version.id]}
+    assert api_client.get('/api/v1/program-students-amount/').data[0]['title'] == 'Photo v1'
+
+
+def test_program_lesson_pointers(program_photo, editor_user, django_assert_max_num_queries):
+    lessons = [Lesson.objects.create(program=program_photo, editor=editor_user, title='Lesson 0', answer='Answer')]
+    for number in range(1, 4):
+        # Savepoint, program lock (a write, then the read on SQLite), insert, pointer update,
+        # progress totals update, release.
+        with django_assert_max_num_queries(7):
+            lessons.append(Lesson.objects.create(program=program_photo, editor=editor_user, title=f'Lesson {number}'))
+
+    program_photo.refresh_from_db()
+    assert program_photo.head_lesson == lessons[0]
+    assert program_photo.tail_lesson == lessons[3]
+    assert [lesson.parent_id for lesson in lessons] == [None, lessons[0].id, lessons[1].id, lessons[2].id]
+    assert lessons[0].answer == 'answer'
+
+    lessons[3].delete()
+
+    program_photo.refresh_from_db()
+    assert program_photo.tail_lesson == lessons[2]
+
+    lesson = Lesson.objects.create(program=program_photo, editor=editor_user, title='Lesson 4')
+
+    assert lesson.parent == lessons[2]
+
+
+def test_lesson_chain(api_client, program_photo, editor_user, manager_user, django_assert_num_queries):
+    lessons = []
+    for number in range(3):
+        with reversion.create_revision():
+            reversion.set_user(editor_user)
+            lessons.append(baker.make(
+                Lesson, is_approved=True, program=program_photo, editor=editor_user, title=f'Lesson {number}'
+            ))
+    # Relink so that chain order differs from id order: 0 -> 2 -> 1.
+    Lesson.objects.filter(pk__in=[lessons[1].pk, lessons[2].pk]).update(parent=None)
+    Lesson.objects.filter(pk=lessons[2].pk).update(parent=lessons[0])
+    Lesson.objects.filter(pk=lessons[1].pk).update(parent=lessons[2])
+
+    with django_assert_num_queries(1):
+        chain = [(lesson.title, lesson.position) for lesson in Lesson.objects.chain(program_photo.pk)]
+
+    assert chain == [('Lesson 0', 0), ('Lesson 2', 1), ('Lesson 1', 2)]
+
+    api_client.force_login(manager_user)
+
+    resp = api_client.get(f'/api/v1/lesson-chain/{program_photo.pk}/')
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert [(item['title'], item['position']) for item in resp.data] == chain
+
+
+def test_lesson_import(api_client, editor_user, program_photo, theme_photoshop, lesson_lightroom):
+    from io import BytesIO
+
+    from reversion.models import Revision
+
+    rows = [
+        {'title': f'Imported {number}', 'theory': 'Theory', 'practice': 'Practice', 'answer': 'Answer'}
+        for number in range(5)
+    ]
+    rows[1]['theme'] = theme_photoshop.pk
+    upload = BytesIO('\n'.join(json.dumps(row) for row in rows).encode())
+    upload.name = 'lessons.jsonl'
+    revision_count = Revision.objects.count()
+
+    api_client.force_login(editor_user)
+
+    resp = api_client.post(f'/api/v1/lesson-import/{program_photo.pk}/', {'file': upload}, format='multipart')
+
+    assert resp.status_code == status.HTTP_201_CREATED
+    assert resp.data == {'imported': 5}
+
+    chain = list(Lesson.objects.chain(program_photo.pk))
+    assert [lesson.title for lesson in chain] == ['About Lightroom'] + [row['title'] for row in rows]
+    assert chain[2].theme == theme_photoshop
+    assert chain[1].answer == 'answer'
+    assert Version.objects.get_for_model(Lesson).count() == 5
+    assert Revision.objects.count() == revision_count + 1
+
+    program_photo.refresh_from_db()
+    assert program_photo.tail_lesson == chain[-1]
+
+    upload.seek(0)
+    resp = api_client.post('/api/v1/lesson-import/0/', {'file': upload}, format='multipart')
+
+    assert resp.status_code == status.HTTP_404_NOT_FOUND
+    assert Lesson.objects.count() == 6
+
+    upload = BytesIO(b'title,theory,practice,answer,theme\nFrom CSV,Theory,Practice,Answer,\n')
+    upload.name = 'lessons'
+    resp = api_client.post(
+        f'/api/v1/lesson-import/{program_photo.pk}/?file_format=csv', {'file': upload}, format='multipart'
+    )
+
+    assert resp.status_code == status.HTTP_201_CREATED
+    assert Lesson.objects.chain(program_photo.pk)[-1].title == 'From CSV'
+
+
+def test_import_lessons_command(tmp_path, editor_user, program_photo):
+    from django.core.management import call_command, CommandError
+
+    path = tmp_path / 'lessons.csv'
+    path.write_text('title,theory,practice,answer,theme\nFirst,Theory,Practice,Answer,\nSecond,Theory,Practice,Answer,\n')
+
+    call_command('import_lessons', program_photo.pk, str(path), editor=editor_user.username, chunk_size=1)
+
+    assert [lesson.title for lesson in Lesson.objects.chain(program_photo.pk)] == ['First', 'Second']
+
+    with pytest.raises(CommandError):
+        call_command('import_lessons', program_photo.pk, str(path), editor=editor_user.username)
+
+    assert Lesson.objects.count() == 2
+
+
+def test_lesson_chain_operations(program_photo, editor_user, student):
+    from photoschool.models import Studying
+
+    first, second, third = [
+        Lesson.objects.create(program=program_photo, editor=editor_user, title=f'Lesson {number}', answer=f'{number}')
+        for number in range(3)
+    ]
+    Studying.objects.create(student=student, lesson=first, answer='0')
+    assert Studying.objects.get(student=student, lesson=second).passed is False
+
+    inserted = Lesson.objects.create(program=program_photo, editor=editor_user, title='Inserted')
+    inserted.insert_after(first.pk)
+
+    assert [lesson.title for lesson in Lesson.objects.chain(program_photo.pk)] == [
+        'Lesson 0', 'Inserted', 'Lesson 1', 'Lesson 2'
+    ]
+    assert Studying.objects.filter(student=student, lesson=inserted).exists()
+    assert not Studying.objects.filter(student=student, lesson=second).exists()
+
+    first.move_after(third.pk)
+
+    assert [lesson.title for lesson in Lesson.objects.chain(program_photo.pk)] == [
+        'Inserted', 'Lesson 1', 'Lesson 2', 'Lesson 0'
+    ]
+    program_photo.refresh_from_db()
+    assert (program_photo.head_lesson, program_photo.tail_lesson) == (inserted, first)
+
+    inserted.delete()
+
+    assert [lesson.title for lesson in Lesson.objects.chain(program_photo.pk)] == ['Lesson 1', 'Lesson 2', 'Lesson 0']
+    assert Studying.objects.get(student=student, lesson=second).passed is False
+    program_photo.refresh_from_db()
+    assert program_photo.head_lesson == second
+
+
+def test_lesson_move_keeps_students_on_the_chain(program_video, editor_user, student, student_user2):
+    from photoschool.models import Student, StudentProgress, Studying
+
+    a, b, c = [
+        Lesson.objects.create(program=program_video, editor=editor_user, title=title, answer=title)
+        for title in ('a', 'b', 'c')
+    ]
+    other = baker.make(Student, user=student_user2)
+    Studying.objects.enroll([student.pk, other.pk], [program_video.pk])
+    Studying.objects.submit_batch(student.pk, [{'lesson_id': a.pk, 'answer': 'a'}])
+
+    def position(student):
+        progress = StudentProgress.objects.get(student=student, program=program_video)
+        waiting = Studying.objects.filter(student=student, lesson__program=program_video, passed=False)
+        return list(waiting.values_list('lesson__title', flat=True)), progress.current_lesson_id
+
+    b.move_after(c.pk)
+
+    assert [lesson.title for lesson in Lesson.objects.chain(program_video.pk)] == ['a', 'c', 'b']
+    assert position(student) == (['c'], c.pk)
+
+    Studying.objects.submit_batch(student.pk, [{'lesson_id': c.pk, 'answer': 'c'}])
+    assert position(student) == (['b'], b.pk)
+    Studying.objects.submit_batch(student.pk, [{'lesson_id': b.pk, 'answer': 'b'}])
+    assert position(student) == ([], None)
+    assert StudentProgress.objects.get(student=student, program=program_video).passed_count == 3
+
+    c.move_after(None)
+
+    assert [lesson.title for lesson in Lesson.objects.chain(program_video.pk)] == ['c', 'a', 'b']
+    assert position(other) == (['c'], c.pk)
+    assert position(student) == ([], None)
+
+
+def test_stale_program_save_keeps_chain_pointers(program_video, editor_user):
+    a, b, c = [
+        Lesson.objects.create(program=program_video, editor=editor_user, title=title, answer=title)
+        for title in ('a', 'b', 'c')
+    ]
+    stale = Program.objects.get(pk=program_video.pk)
+    c.move_after(None)
+
+    stale.description = 'Edited'
+    stale.save()
+    Lesson.objects.create(program=program_video, editor=editor_user, title='d', answer='d')
+
+    assert [lesson.title for lesson in Lesson.objects.chain(program_video.pk)] == ['c', 'a', 'b', 'd']
+
+    # Pointers lost some other way are rebuilt from the links, not from id order.
+    Program.objects.filter(pk=program_video.pk).update(head_lesson=None, tail_lesson=None)
+    Lesson.objects.create(program=program_video, editor=editor_user, title='e', answer='e')
+    assert [lesson.title for lesson in Lesson.objects.chain(program_video.pk)] == ['c', 'a', 'b', 'd', 'e']
+    program_video.refresh_from_db()
+    assert program_video.head_lesson == c
+
+
+def test_lesson_insert_and_move_api(api_client, editor_user, program_photo, lesson_photoshop_retouch, lesson_lightroom):
+    api_client.force_login(editor_user)
+
+    resp = api_client.post(f'/api/v1/lesson/{program_photo.pk}/', {
+        'title': 'Head', 'theory': 'Theory', 'practice': 'Practice', 'answer': 'Answer', 'after': ''
+    })
+
+    assert resp.status_code == status.HTTP_201_CREATED
+    assert 'after' not in resp.data
+
+    resp = api_client.put(f'/api/v1/lesson-move/{lesson_photoshop_retouch.pk}/', {
+        'after': lesson_lightroom.pk
+    }, format='json')
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert [lesson.title for lesson in Lesson.objects.chain(program_photo.pk)] == [
+        'Head', 'About Lightroom', 'About Photoshop retouch'
+    ]
+
+    resp = api_client.put(f'/api/v1/lesson-move/{lesson_photoshop_retouch.pk}/', {
+        'after': lesson_photoshop_retouch.pk
+    }, format='json')
+
+    assert resp.status_code == status.HTTP_400_BAD_REQUEST
+
+    resp = api_client.delete(f'/api/v1/lesson/{program_photo.pk}/{lesson_lightroom.pk}/')
+
+    assert resp.status_code == status.HTTP_204_NO_CONTENT
+    assert [lesson.title for lesson in Lesson.objects.chain(program_photo.pk)] == ['Head', 'About Photoshop retouch']
+
+
+def test_studying_submit(student, studying, lesson_photoshop_retouch, lesson_lightroom, django_assert_num_queries):
+    from photoschool.models import Studying
+
+    # Savepoint, grading update, reload, unlock insert, progress update, release.
+    with django_assert_num_queries(6):
+        studying.submit('Retouch')
+
+    assert studying.passed is True
+    studying.refresh_from_db()
+    assert (studying.answer, studying.passed) == ('Retouch', True)
+    next_studying = Studying.objects.get(student=student, lesson=lesson_lightroom)
+    assert next_studying.passed is False
+
+    next_studying.submit('photoshop')
+
+    assert next_studying.passed is False
+    assert Studying.objects.filter(student=student).count() == 2
+
+
+def test_studying_batch_submit(
+        api_client, student_user, student, studying, lesson_photoshop_retouch, lesson_lightroom, lesson_pixelmator
+):
+    from photoschool.models import Studying
+
+    api_client.force_login(student_user)
+
+    resp = api_client.post('/api/v1/studying-submit/', {'answers': [
+        {'studying_id': studying.id, 'answer': 'wrong'},
+        {'studying_id': studying.id, 'answer': 'Retouch'},
+        {'lesson_id': lesson_lightroom.id, 'answer': 'lightroom'},
+        {'lesson_id': lesson_pixelmator.id, 'answer': 'photoshop'},
+        {'studying_id': studying.id, 'answer': 'retouch'},
+    ]}, format='json')
+
+    assert resp.status_code == status.HTTP_200_OK
+    lightroom = Studying.objects.get(student=student, lesson=lesson_lightroom)
+    pixelmator = Studying.objects.get(student=student, lesson=lesson_pixelmator)
+    assert resp.data == [
+        {'lesson': lesson_photoshop_retouch.id, 'studying_id': studying.id, 'passed': False},
+        {'lesson': lesson_photoshop_retouch.id, 'studying_id': studying.id, 'passed': True},
+        {'lesson': lesson_lightroom.id, 'studying_id': lightroom.id, 'passed': True},
+        {'lesson': lesson_pixelmator.id, 'studying_id': pixelmator.id, 'passed': False},
+        {'studying_id': studying.id, 'answer': 'retouch', 'error': 'Lesson is not available.'},
+    ]
+    assert lightroom.passed is True
+    assert (pixelmator.answer, pixelmator.passed) == ('photoshop', False)
+
+    resp = api_client.post('/api/v1/studying-submit/', {'answers': [{'answer': 'retouch'}]}, format='json')
+
+    assert resp.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_studying_enroll(
+        program_photo, program_video, lesson_photoshop_retouch, lesson_lightroom, student, django_assert_max_num_queries
+):
+    from photoschool.models import Student, Studying
+
+    students = baker.make(Student, _quantity=3)
+    program_photo.students.add(students[0])
+
+    assert Studying.objects.filter(student=students[0], lesson=lesson_photoshop_retouch).exists()
+
+    # A membership insert and a count update per program, the pointer check, two progress inserts,
+    # plus savepoints and releases for the nested transactions.
+    with django_assert_max_num_queries(11):
+        Studying.objects.enroll([student.pk for student in students], [program_photo.pk, program_video.pk])
+
+    assert Studying.objects.filter(lesson=lesson_photoshop_retouch).count() == 3
+    assert Studying.objects.count() == 3
+    assert all(
+        set(student.open_programs.all()) == {program_photo, program_video} for student in students
+    )
+    program_photo.refresh_from_db()
+    program_video.refresh_from_db()
+    assert (program_photo.student_count, program_video.student_count) == (3, 3)
+    assert not Program.objects.stale_counts().exists()
+
+
+def test_studying_teardown(
+        program_photo, program_video, lesson_photoshop_retouch, student, student_user2,
+        django_capture_on_commit_callbacks
+):
+    from photoschool.models import Student, Studying
+
+    other_student = baker.make(Student, user=student_user2)
+    video_lesson = baker.make(Lesson, program=program_video, title='Video lesson')
+    for enrolled in (student, other_student):
+        enrolled.open_programs.add(program_photo, program_video)
+
+    # Torn down after commit, and not at all for memberships re-opened before then.
+    with django_capture_on_commit_callbacks(execute=True):
+        student.open_programs.remove(program_video)
+        student.open_programs.add(program_video)
+        assert Studying.objects.filter(student=student, lesson=video_lesson).exists()
+    assert Studying.objects.filter(student=student, lesson=video_lesson).exists()
+
+    with django_capture_on_commit_callbacks(execute=True):
+        student.open_programs.remove(program_photo)
+
+    assert not Studying.objects.filter(student=student, lesson=lesson_photoshop_retouch).exists()
+    assert Studying.objects.filter(student=student, lesson=video_lesson).exists()
+    assert Studying.objects.filter(student=other_student).count() == 2
+
+    with django_capture_on_commit_callbacks(execute=True):
+        program_video.students.remove(other_student)
+
+    assert list(Studying.objects.filter(student=other_student).values_list('lesson', flat=True)) == [
+        lesson_photoshop_retouch.pk
+    ]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        student.open_programs.clear()
+
+    assert not Studying.objects.filter(student=student).exists()
+    assert Studying.objects.filter(student=other_student).count() == 1
+
+
 # --------------------------------------------- PERMISSIONS ---------------------------------------------
 
 
@@ -1400,3 +1957,647 @@ def test_superuser_student_login_permission(api_client, student_user):
     resp = api_client.get('/api/v1/users/')
 
     assert resp.status_code == status.HTTP_403_FORBIDDEN
+
+
+def test_student_progress(
+        student, studying, program_photo, editor_user, lesson_photoshop_retouch, lesson_lightroom, lesson_pixelmator,
+        django_capture_on_commit_callbacks
+):
+    from django.core.management import call_command
+    from photoschool.models import StudentProgress, Studying
+
+    def progress():
+        row = StudentProgress.objects.get(student=student, program=program_photo)
+        return row.passed_count, row.total_lessons, row.current_lesson_id
+
+    assert progress() == (0, 3, lesson_photoshop_retouch.id)
+
+    studying.submit('retouch')
+    studying.submit('wrong')
+
+    assert progress() == (1, 3, lesson_lightroom.id)
+    assert StudentProgress.objects.get(student=student, program=program_photo).last_activity is not None
+
+    Studying.objects.submit_batch(student.id, [{'lesson_id': lesson_lightroom.id, 'answer': 'lightroom'}])
+    extra = Lesson.objects.create(program=program_photo, editor=editor_user, title='Extra', answer='extra')
+
+    assert progress() == (2, 4, lesson_pixelmator.id)
+
+    lesson_lightroom.delete()
+
+    assert progress() == (1, 3, lesson_pixelmator.id)
+
+    StudentProgress.objects.update(passed_count=0, total_lessons=0)
+    call_command('rebuild_progress')
+
+    assert progress() == (1, 3, lesson_pixelmator.id)
+
+    extra.delete()
+    with django_capture_on_commit_callbacks(execute=True):
+        student.open_programs.remove(program_photo)
+
+    assert not StudentProgress.objects.filter(student=student).exists()
+
+
+def test_rebuild_progress_follows_the_chain(program_photo, program_video, editor_user, student, student_user2):
+    from photoschool.models import Student, StudentProgress, Studying
+
+    a, b, c = [
+        Lesson.objects.create(program=program_video, editor=editor_user, title=title, answer=title)
+        for title in ('a', 'b', 'c')
+    ]
+    c.move_after(None)
+    photo = Lesson.objects.create(program=program_photo, editor=editor_user, title='photo', answer='photo')
+    other = baker.make(Student, user=student_user2)
+    Studying.objects.enroll([student.pk, other.pk], [program_video.pk, program_photo.pk])
+    Studying.objects.submit_batch(student.pk, [{'lesson_id': c.pk, 'answer': 'c'}])
+    # An unpassed row left behind by an earlier chain, with a higher id than the current lesson.
+    Studying.objects.bulk_create([Studying(student=student, lesson=b)])
+
+    def snapshot():
+        return sorted(StudentProgress.objects.values_list(
+            'student_id', 'program_id', 'passed_count', 'total_lessons', 'current_lesson_id'
+        ))
+
+    expected = snapshot()
+    assert (student.pk, program_video.pk, 1, 3, a.pk) in expected
+    assert (other.pk, program_photo.pk, 0, 1, photo.pk) in expected
+
+    StudentProgress.objects.update(passed_count=0, current_lesson=None)
+
+    assert StudentProgress.objects.rebuild(batch_size=1) == 4
+    assert snapshot() == expected
+
+
+def test_program_membership_counts(api_client, manager_user, program_photo, program_video, student, student_user2):
+    from django.core.management import call_command, CommandError
+    from photoschool.models import Student
+
+    other_student = baker.make(Student, user=student_user2)
+    stale_photo = Program.objects.get(pk=program_photo.pk)
+
+    def counts(program):
+        program.refresh_from_db()
+        return program.student_count, program.wish_count
+
+    student.open_programs.add(program_photo, program_video)
+    student.open_programs.add(program_photo)
+    program_photo.students.add(other_student)
+    student.wish_programs.add(program_video)
+    program_video.student_set.add(other_student)
+
+    assert counts(program_photo) == (2, 0)
+    assert counts(program_video) == (1, 2)
+
+    stale_photo.title = 'Renamed'
+    stale_photo.save()
+    student.open_programs.remove(program_photo, program_photo)
+    program_video.students.remove(other_student)
+    student.wish_programs.clear()
+
+    assert counts(program_photo) == (1, 0)
+    assert counts(program_video) == (1, 1)
+
+    program_video.student_set.clear()
+    other_student.delete()
+
+    assert counts(program_photo) == (0, 0)
+    assert counts(program_video) == (1, 0)
+
+    api_client.force_login(manager_user)
+    resp = api_client.get('/api/v1/program-students-amount/')
+
+    assert sorted((row['title'], row['student_amount']) for row in resp.data) == [
+        ('Renamed', 0), (program_video.title, 1)
+    ]
+
+    Program.objects.filter(pk=program_video.pk).update(student_count=5, wish_count=3)
+    with pytest.raises(CommandError):
+        call_command('check_enrollment_counts')
+    call_command('check_enrollment_counts', fix=True)
+    call_command('check_enrollment_counts')
+
+    assert counts(program_video) == (1, 0)
+
+
+def test_studying_batch_submit_keeps_passed_child(
+        student, studying, program_photo, lesson_photoshop_retouch, lesson_lightroom, lesson_pixelmator
+):
+    from photoschool.models import StudentProgress, Studying
+
+    # The student passed lightroom while it headed the chain, before it was moved back behind retouch.
+    lesson_lightroom.move_after(None)
+    Studying.objects.submit_batch(student.id, [{'lesson_id': lesson_lightroom.id, 'answer': 'lightroom'}])
+    lesson_lightroom.move_after(lesson_photoshop_retouch.pk)
+    retouch = Studying.objects.get(student=student, lesson=lesson_photoshop_retouch, passed=False)
+    passed_count = StudentProgress.objects.get(student=student, program=program_photo).passed_count
+
+    result = Studying.objects.submit_batch(student.id, [
+        {'lesson_id': lesson_photoshop_retouch.id, 'answer': 'retouch'},
+        {'lesson_id': lesson_lightroom.id, 'answer': 'lightroom'},
+    ])
+
+    assert result == [
+        {'lesson': lesson_photoshop_retouch.id, 'studying_id': retouch.id, 'passed': True},
+        {'lesson_id': lesson_lightroom.id, 'answer': 'lightroom', 'error': 'Lesson is not available.'},
+    ]
+    assert StudentProgress.objects.get(student=student, program=program_photo).passed_count == passed_count + 1
+    assert list(
+        Studying.objects.filter(student=student, lesson=lesson_lightroom).values_list('answer', 'passed')
+    ) == [('lightroom', True)]
+
+
+def test_lesson_unlock_pass(
+        django_capture_on_commit_callbacks, api_client, editor_user, program_photo, student, studying,
+        lesson_photoshop_retouch, lesson_lightroom, lesson_pixelmator
+):
+    from photoschool.models import StudentProgress, Studying
+
+    Studying.objects.submit_batch(student.id, [
+        {'lesson_id': lesson_photoshop_retouch.id, 'answer': 'retouch'},
+        {'lesson_id': lesson_lightroom.id, 'answer': 'lightroom'},
+        {'lesson_id': lesson_pixelmator.id, 'answer': 'pixelmator'},
+    ])
+    assert StudentProgress.objects.get(student=student, program=program_photo).current_lesson is None
+
+    api_client.force_login(editor_user)
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        resp = api_client.post(f'/api/v1/lesson/{program_photo.pk}/', {
+            'title': 'Appended', 'theory': 'Theory', 'practice': 'Practice', 'answer': 'appended'
+        }, format='json')
+
+    assert resp.status_code == status.HTTP_201_CREATED
+    assert len(callbacks) == 1
+    appended = Studying.objects.get(student=student, lesson_id=resp.data['id'])
+    assert (appended.answer, appended.passed) == ('', False)
+    assert StudentProgress.objects.get(student=student, program=program_photo).current_lesson_id == resp.data['id']
+
+    assert Studying.objects.unlock_lesson(resp.data['id']) == 0
+
+
+def test_background_tasks(settings, django_capture_on_commit_callbacks):
+    import threading
+    from django.db import OperationalError
+    from photoschool import tasks
+
+    settings.PHOTOSCHOOL_TASKS_EAGER = False
+    settings.PHOTOSCHOOL_TASK_RETRY_DELAY = 0
+    calls = []
+
+    def locked_twice(name):
+        calls.append((name, threading.current_thread().name))
+        if len(calls) < 3:
+            raise OperationalError('database is locked')
+
+    with django_capture_on_commit_callbacks(execute=True):
+        tasks.run_after_commit(locked_twice, 'unlock')
+    tasks.wait()
+
+    assert calls == [('unlock', 'photoschool-tasks')] * 3
+
+    settings.PHOTOSCHOOL_TASK_RETRIES = 1
+    calls.clear()
+    with django_capture_on_commit_callbacks(execute=True):
+        tasks.run_after_commit(locked_twice, 'given up')
+        tasks.run_after_commit(calls.append, ('next', None))
+    tasks.wait()
+
+    assert [call[0] for call in calls] == ['given up', 'given up', 'next']
+
+
+def test_lesson_unlock_head_and_bulk_approve(
+        django_capture_on_commit_callbacks, api_client, editor_user, manager_user, program_video, student
+):
+    from photoschool.models import StudentProgress, Studying
+
+    # Opened while the program had no lessons.
+    student.open_programs.add(program_video)
+    with django_capture_on_commit_callbacks(execute=True):
+        first = baker.make(Lesson, program=program_video, editor=editor_user, title='First', answer='first')
+    assert Studying.objects.filter(student=student, lesson=first).exists()
+    assert StudentProgress.objects.get(student=student, program=program_video).current_lesson_id == first.pk
+    Studying.objects.get(student=student, lesson=first).submit('first')
+
+    # Created without its unlock pass running, then approved in bulk.
+    with reversion.create_revision():
+        reversion.set_user(editor_user)
+        second = Lesson.objects.create(program=program_video, editor=editor_user, title='Second', answer='second')
+    Studying.objects.filter(student=student, lesson=second).delete()
+    api_client.force_login(manager_user)
+    with django_capture_on_commit_callbacks(execute=True):
+        resp = api_client.put('/api/v1/versions-approve/', {
+            'versions': [{'version_id': Version.objects.get_for_object(second).get().id, 'approved': True}]
+        }, format='json')
+    assert resp.status_code == status.HTTP_200_OK
+    assert Studying.objects.filter(student=student, lesson=second, passed=False).exists()
+
+
+def test_lesson_theme_tree_cache(
+        api_client, manager_user, editor_user, program_photo, theme_photoshop, lesson_photoshop_retouch,
+        lesson_pixelmator, django_assert_max_num_queries
+):
+    for lesson in (lesson_photoshop_retouch, lesson_pixelmator):
+        with reversion.create_revision():
+            reversion.set_user(editor_user)
+            lesson.save()
+
+    api_client.force_login(manager_user)
+    url = f'/api/v1/lesson-theme/{program_photo.pk}/'
+    cold = api_client.get(url).data
+    assert [lesson['id'] for lesson in cold['with_theme'][0]['lessons']] == [lesson_pixelmator.id]
+
+    # Session, user and the generation lookups for the ETag and the cache key.
+    with django_assert_max_num_queries(4):
+        assert api_client.get(url).data == cold
+
+    with reversion.create_revision():
+        reversion.set_user(editor_user)
+        Theme.objects.get(pk=theme_photoshop.pk).save()
+    generation = Program.objects.get(pk=program_photo.pk).content_generation
+    resp = api_client.put(f'/api/v1/theme-approve/{theme_photoshop.pk}/', {
+        'version_id': Version.objects.get_for_object(theme_photoshop).first().pk, 'approved': True
+    }, format='json')
+    assert resp.status_code == status.HTTP_200_OK
+    assert Program.objects.get(pk=program_photo.pk).content_generation > generation
+
+    generation = Program.objects.get(pk=program_photo.pk).content_generation
+    lesson_pixelmator.delete()
+    assert Program.objects.get(pk=program_photo.pk).content_generation > generation
+
+    data = api_client.get(url).data
+    assert data['with_theme'][0]['lessons'] == []
+    assert [lesson['id'] for lesson in data['without_theme']] == [lesson_photoshop_retouch.id]
+
+
+def test_published_content_etags(
+        api_client, manager_user, editor_user, student_user, student, studying, program_photo, program_video,
+        lesson_photoshop_retouch
+):
+    with reversion.create_revision():
+        reversion.set_user(editor_user)
+        lesson_photoshop_retouch.save()
+
+    api_client.force_login(manager_user)
+    for url in (
+        '/api/v1/program-list/', f'/api/v1/lesson-list/{program_photo.pk}/', f'/api/v1/lesson-theme/{program_photo.pk}/'
+    ):
+        resp = api_client.get(url)
+        etag = resp['ETag']
+        assert resp.status_code == status.HTTP_200_OK and etag.startswith('"')
+
+        resp = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert resp.status_code == status.HTTP_304_NOT_MODIFIED
+        assert not resp.content
+
+        Program.bump_generation(program_photo.pk)
+        resp = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert resp.status_code == status.HTTP_200_OK
+        assert resp['ETag'] != etag
+
+    api_client.force_login(student_user)
+    url = f'/api/v1/available-lessons/{program_photo.pk}/'
+    etag = api_client.get(url)['ETag']
+
+    assert api_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == status.HTTP_304_NOT_MODIFIED
+
+    studying.submit('wrong')
+    resp = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert resp.data[0]['answer'] == 'wrong'
+    assert 'ETag' not in api_client.get(f'/api/v1/available-lessons/{program_video.pk}/')
+
+
+def test_permission_query_budget(student_user, editor_user, student, studying, django_assert_num_queries):
+    from django.contrib.auth.models import AnonymousUser
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+    from photoschool.models import Studying
+    from photoschool.permissions import IsStaffPermission, IsStudyingOwnerPermission
+
+    rows = list(Studying.objects.all()) + [baker.make(Studying)]
+    request = Request(APIRequestFactory().get('/'))
+    request.user = get_user_model().objects.get(pk=student_user.pk)
+    owner = IsStudyingOwnerPermission()
+
+    with django_assert_num_queries(1):
+        assert owner.has_permission(request, None)
+        assert [owner.has_object_permission(request, None, row) for row in rows] == [True, False]
+        assert not IsStaffPermission().has_permission(request, None)
+
+    request.user = get_user_model().objects.get(pk=editor_user.pk)
+    with django_assert_num_queries(1):
+        assert not owner.has_permission(request, None)
+        assert IsStaffPermission().has_permission(request, None)
+
+    request.user = AnonymousUser()
+    with django_assert_num_queries(0):
+        assert not owner.has_permission(request, None)
+        assert not IsStaffPermission().has_permission(request, None)
+
+
+def test_cached_token_authentication(api_client, student_user):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework.authtoken.models import Token
+
+    token = Token.objects.create(user=student_user)
+    api_client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    with CaptureQueriesContext(connection) as cold:
+        assert api_client.get('/api/v1/program-list/').status_code == status.HTTP_200_OK
+    with CaptureQueriesContext(connection) as warm:
+        assert api_client.get('/api/v1/program-list/').status_code == status.HTTP_200_OK
+
+    assert len(warm) == len(cold) - 1
+    assert not any('authtoken_token' in query['sql'] for query in warm.captured_queries)
+
+    student_user.is_active = False
+    student_user.save()
+
+    assert api_client.get('/api/v1/program-list/').status_code == status.HTTP_401_UNAUTHORIZED
+
+    student_user.is_active = True
+    student_user.save()
+    assert api_client.get('/api/v1/program-list/').status_code == status.HTTP_200_OK
+
+    token.delete()
+
+    assert api_client.get('/api/v1/program-list/').status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_token_revocation_reaches_other_processes(student_user, editor_user):
+    from rest_framework.authtoken.models import Token
+    from photoschool.cache import TieredCache, TokenCache, token_cache
+
+    # Two processes: separate, empty L1s over the same shared L2.
+    this, other = [TokenCache(TieredCache('token', timeout=60, local_size=0, alias='photoschool')) for _ in range(2)]
+    token = Token.objects.create(user=student_user)
+    editor_token = Token.objects.create(user=editor_user)
+    for key, user, cached_token in ((token.key, student_user, token), (editor_token.key, editor_user, editor_token)):
+        this.set(key, user, cached_token)
+    assert other.get(token.key)[0] == student_user
+
+    this.revoke(token.key)
+
+    assert other.get(token.key) is None
+    assert other.get(editor_token.key)[0] == editor_user
+
+    # Signals evict the tokens of the user concerned, and leave every other entry in place.
+    token_cache.set(token.key, student_user, token)
+    token_cache.set(editor_token.key, editor_user, editor_token)
+    student_user.first_name = 'Renamed'
+    student_user.save()
+
+    assert token_cache.get(token.key) is None
+    assert token_cache.get(editor_token.key)[0] == editor_user
+
+    editor_key = editor_token.key
+    editor_token.delete()
+
+    assert token_cache.get(editor_key) is None
+
+
+def test_tiered_cache(
+        api_client, manager_user, student, program_photo, django_capture_on_commit_callbacks,
+        django_assert_max_num_queries
+):
+    from django.contrib.auth import get_user_model
+    from photoschool.cache import TieredCache, enrollment_cache
+
+    cache = TieredCache('test', timeout=60, local_size=2, alias='photoschool', generational=True)
+    cache.set('a', 1)
+    cache.local.clear()
+
+    assert cache.get('a') == 1
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+
+    cache.invalidate()
+
+    assert cache.get('a') is None
+    assert {key: cache.stats()[key] for key in ('l1_hits', 'l2_hits', 'misses', 'invalidations')} == {
+        'l1_hits': 1, 'l2_hits': 1, 'misses': 2, 'invalidations': 1
+    }
+
+    api_client.force_login(manager_user)
+    url = '/api/v1/program-students-amount/'
+    assert api_client.get(url).data == [{'title': program_photo.title, 'student_amount': 0}]
+
+    # Session and user only.
+    with django_assert_max_num_queries(2):
+        assert api_client.get(url).data == [{'title': program_photo.title, 'student_amount': 0}]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        student.open_programs.add(program_photo)
+
+    assert api_client.get(url).data == [{'title': program_photo.title, 'student_amount': 1}]
+    assert enrollment_cache.stats()['invalidations'] == 1
+
+    assert api_client.get('/api/v1/cache-stats/').status_code == status.HTTP_403_FORBIDDEN
+    api_client.force_login(get_user_model().objects.get(username='admin'))
+    stats = api_client.get('/api/v1/cache-stats/').data
+    assert {'version', 'token', 'curriculum', 'enrollment'} <= set(stats)
+    assert stats['enrollment']['l1_hits'] >= 1
+
+
+def test_lean_serializers_render_identical_json(
+        editor_user, student, studying, lesson_photoshop_retouch, lesson_lightroom, lesson_not_approve
+):
+    from django.db.models import Sum
+    from django.db.models.functions import Coalesce
+    from rest_framework.renderers import JSONRenderer
+    from photoschool.lean import LeanLessonSerializer, LeanStudentLessonsPassedSerializer, LeanStudyingSerializer
+    from photoschool.models import Student, Studying
+    from photoschool.serializers import LessonSerializer, StudentLessonsPassedSerializer, StudyingSerializer
+
+    with reversion.create_revision():
+        reversion.set_user(editor_user)
+        lesson_photoshop_retouch.save()
+    studying.submit('retouch')
+    students = Student.objects.annotate(amount_passed_lesson=Coalesce(Sum('progress__passed_count'), 0))
+    render = JSONRenderer().render
+
+    for serializer, lean, queryset in (
+        (LessonSerializer, LeanLessonSerializer, Lesson.objects.all()),
+        (StudyingSerializer, LeanStudyingSerializer, Studying.objects.select_related('lesson')),
+        (StudentLessonsPassedSerializer, LeanStudentLessonsPassedSerializer, students),
+    ):
+        expected = render(serializer(queryset, many=True).data)
+        assert render(lean(queryset).data) == expected
+        assert render(lean(list(queryset)).data) == expected
+
+
+def test_streamed_manager_reports(api_client, manager_user, student, program_photo, program_video, monkeypatch):
+    from photoschool.models import Student
+    from photoschool.views import StudentLessonsPassedListAPIIView
+
+    student.open_programs.add(program_photo, program_video)
+    for student_user in baker.make(get_user_model(), _quantity=4):
+        baker.make(Student, user=student_user).open_programs.add(program_photo)
+    # Several chunks per response.
+    monkeypatch.setattr(StudentLessonsPassedListAPIIView, 'stream_chunk_size', 2)
+
+    api_client.force_login(manager_user)
+    for url in (
+        '/api/v1/program-students-amount/',
+        f'/api/v1/student-subscribed/{program_photo.pk}/',
+        '/api/v1/students-lesson-passed/?limit=500',
+    ):
+        resp = api_client.get(url, {'stream': 1})
+        assert resp.status_code == status.HTTP_200_OK
+        assert resp.streaming
+        assert resp['Content-Type'] == 'application/json'
+        streamed = json.loads(b''.join(resp.streaming_content))
+        expected = api_client.get(url).data
+        assert sorted(streamed, key=json.dumps) == sorted(json.loads(json.dumps(expected)), key=json.dumps)
+
+    resp = api_client.get(f'/api/v1/student-subscribed/{program_video.pk}/', {'stream': 'true'})
+    assert json.loads(b''.join(resp.streaming_content)) == [{'id': student.pk, 'user': student.user_id}]
+    assert not api_client.get('/api/v1/students-lesson-passed/', {'stream': 0}).streaming
+
+
+def test_orjson_renderer_and_parser(api_client, manager_user, lesson_photoshop_retouch, lesson_not_approve, monkeypatch):
+    import io
+    from rest_framework.exceptions import ParseError
+    from rest_framework.renderers import JSONRenderer
+    from photoschool import renderers
+
+    lesson_photoshop_retouch.theory = 'Curves\u2028 and étendue "levels"'
+    lesson_photoshop_retouch.save()
+    api_client.force_login(manager_user)
+    resp = api_client.get('/api/v1/lesson-approve-list/')
+    assert resp.content == JSONRenderer().render(resp.data)
+    assert json.loads(resp.content) == json.loads(json.dumps(resp.data))
+
+    data = [{'id': 1, 'title': 'Portrait', 'answer': None, 'is_approved': True}]
+    parser = renderers.ORJSONParser()
+    assert parser.parse(io.BytesIO(renderers.ORJSONRenderer().render(data))) == data
+    with pytest.raises(ParseError):
+        parser.parse(io.BytesIO(b'{"title": '))
+
+    # Without orjson both fall back to DRF's json implementation.
+    monkeypatch.setattr(renderers, 'orjson', None)
+    assert renderers.ORJSONRenderer().render(data) == JSONRenderer().render(data)
+    assert parser.parse(io.BytesIO(b'[{"id": 1}]')) == [{'id': 1}]
+    assert api_client.get('/api/v1/lesson-approve-list/').content == resp.content
+
+
+def test_sparse_fieldsets(
+        api_client, editor_user, manager_user, student_user, student, studying, lesson_photoshop_retouch,
+        lesson_not_approve
+):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    with reversion.create_revision():
+        reversion.set_user(editor_user)
+        lesson_photoshop_retouch.save()
+
+    api_client.force_login(manager_user)
+    url = '/api/v1/lesson-approve-list/'
+    with CaptureQueriesContext(connection) as queries:
+        resp = api_client.get(url, {'fields': 'id,title'})
+    assert resp.data == [{'id': lesson_not_approve.pk, 'title': lesson_not_approve.title}]
+    assert 'theory' not in queries.captured_queries[-1]['sql']
+    full = api_client.get(url).data[0]
+    assert api_client.get(url, {'omit': 'theory,answer'}).data[0] == {
+        name: value for name, value in full.items() if name not in ('theory', 'answer')
+    }
+    assert api_client.get(url, {'fields': 'unknown'}).data == [{}]
+
+    api_client.force_login(student_user)
+    url = '/api/v1/studying/'
+    full = api_client.get(url).data[0]
+    resp = api_client.get(url, {'fields': 'id,actual_lesson.title,actual_lesson.editor'})
+    assert resp.data == [
+        {'id': studying.pk, 'actual_lesson': {'title': lesson_photoshop_retouch.title, 'editor': 'editor'}}
+    ]
+    resp = api_client.get(url, {'omit': 'actual_lesson.theory,answer'})
+    assert resp.data[0]['actual_lesson'] == {
+        key: value for key, value in full['actual_lesson'].items() if key != 'theory'
+    }
+    assert 'answer' not in resp.data[0]
+    # The embedded lesson is looked up through the lesson column even when it is not returned.
+    assert api_client.get(url, {'fields': 'actual_lesson'}).data == [{'actual_lesson': full['actual_lesson']}]
+    assert api_client.get(url, {'omit': 'actual_lesson'}).data[0] == {
+        name: value for name, value in full.items() if name != 'actual_lesson'
+    }
+
+    # Single objects through the DRF serializer, and writes ignore the fieldset.
+    detail = f'{url}{studying.pk}/'
+    assert api_client.get(detail, {'fields': 'passed,actual_lesson.answer'}).data == {
+        'passed': False, 'actual_lesson': {'answer': 'retouch'}
+    }
+    resp = api_client.patch(f'{detail}?fields=id', {'answer': 'retouch'}, format='json')
+    assert resp.data['passed'] is True
+
+
+def test_sparse_fieldsets_keep_json_types(api_client, editor_user, student_user, student, program_photo):
+    from photoschool.models import Studying
+
+    with reversion.create_revision():
+        reversion.set_user(editor_user)
+        lesson = Lesson.objects.create(
+            program=program_photo, editor=editor_user, is_approved=True, title='2024', theory='1.5',
+            practice='true', answer='42'
+        )
+    baker.make(Studying, student=student, lesson=lesson)
+
+    api_client.force_login(student_user)
+    full = api_client.get('/api/v1/studying/').data[0]['actual_lesson']
+    resp = api_client.get('/api/v1/studying/', {
+        'fields': 'actual_lesson.title,actual_lesson.is_approved,actual_lesson.answer,actual_lesson.practice,'
+                  'actual_lesson.theory,actual_lesson.parent_id'
+    })
+    actual_lesson = json.loads(resp.content)[0]['actual_lesson']
+    assert actual_lesson == {
+        'title': '2024', 'is_approved': True, 'parent_id': None, 'theory': '1.5', 'practice': 'true', 'answer': '42'
+    }
+    # 1 == True in Python, so a boolean decoded as an integer needs a type check.
+    assert actual_lesson['is_approved'] is True
+    assert all(type(value) is type(full[key]) and value == full[key] for key, value in actual_lesson.items())
+
+
+def test_queryset_delete_keeps_one_chain(program_video, editor_user, student):
+    from photoschool.models import Studying
+
+    lessons = [
+        Lesson.objects.create(program=program_video, editor=editor_user, title=title, answer=title)
+        for title in ('a', 'b', 'c', 'd')
+    ]
+    student.open_programs.add(program_video)
+    Studying.objects.get(student=student, lesson=lessons[0]).submit('a')
+
+    deleted, per_model = Lesson.objects.filter(pk__in=[lessons[1].pk, lessons[3].pk]).delete()
+
+    assert per_model['photoschool.Lesson'] == 2
+    chain = Lesson.objects.chain(program_video.pk)
+    assert [(lesson.title, lesson.position) for lesson in chain] == [('a', 0), ('c', 1)]
+    program_video.refresh_from_db()
+    assert (program_video.head_lesson, program_video.tail_lesson) == (lessons[0], lessons[2])
+    assert Studying.objects.filter(student=student, lesson=lessons[2], passed=False).exists()
+
+
+def test_unpublished_objects_get_a_marker(editor_user, lesson_not_approve, django_assert_num_queries):
+    from photoschool.models import PublishedVersion
+
+    for number in range(3):
+        with reversion.create_revision():
+            reversion.set_user(editor_user)
+            lesson_not_approve.title = f'Draft {number}'
+            lesson_not_approve.save()
+
+    assert PublishedVersion.objects.get_for_ids(Lesson, [lesson_not_approve.pk]) == {}
+    # The marker answers from then on; the history is not read again.
+    with django_assert_num_queries(1):
+        assert PublishedVersion.objects.get_for_ids(Lesson, [lesson_not_approve.pk]) == {}
+    assert lesson_not_approve.actual_version is None
+
+    with reversion.create_revision():
+        reversion.set_user(editor_user)
+        lesson_not_approve.is_approved = True
+        lesson_not_approve.save()
+
+    assert Lesson.objects.get(pk=lesson_not_approve.pk).actual_version['title'] == 'Draft 2'
+    assert PublishedVersion.objects.filter(object_id=str(lesson_not_approve.pk)).count() == 1
@@ -37,8 +37,16 @@ urlpatterns = [
     path('lesson-history/<int:pk>/', views.LessonHistoryRollBackAPIView.as_view()),
     path('lesson-theme/<int:program_id>/', views.LessonThemeListAPIView.as_view()),
     path('lesson-list/<int:program_id>/', views.LessonListAPIView.as_view()),
+    path('lesson-chain/<int:program_id>/', views.LessonChainListAPIView.as_view()),
+    path('lesson-import/<int:program_id>/', views.LessonImportAPIView.as_view()),
+    path('lesson-move/<int:pk>/', views.LessonMoveAPIView.as_view()),
+    # Version
+    path('versions-approve/', views.VersionBulkApproveAPIView.as_view()),
 
+    path('studying-submit/', views.StudyingBatchSubmitAPIView.as_view()),
     path('available-lessons/<int:program_id>/', views.AvailableLessonProgramListAPIView.as_view()),
     path('students-lesson-passed/', views.StudentLessonsPassedListAPIIView.as_view()),
     path('student-subscribed/<int:program_id>/', views.StudentProgramSubscribedListAPIIView.as_view()),
+    # Cache
+    path('cache-stats/', views.CacheStatsAPIView.as_view()),
 ]
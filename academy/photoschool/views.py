@@ -1,20 +1,39 @@
-from django.db.models import When, Count, Case
-from rest_framework import viewsets, generics
+import codecs
+from collections import defaultdict
+
+import reversion
+from django.db import transaction
+from django.db.models import Sum
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from django.db.models.functions import Coalesce
+from rest_framework import viewsets, generics, status
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from reversion.models import Version
 
-from .models import Program, Theme, Lesson, Student, Studying
+from .cache import curriculum_cache, enrollment_cache, namespaces, version_cache
+from .etags import available_lessons_etag, program_content_etag, program_list_etag
+from .importers import import_lessons, read_rows
+from .lean import (
+    LeanListMixin, LeanLessonSerializer, LeanProgramShortSerializer, LeanStudyingSerializer,
+    LeanStudentLessonsPassedSerializer, LeanStudentShortSerializer
+)
+from .models import Program, Theme, Lesson, Student, Studying, PublishedVersion
+from .pagination import KeysetPagination
 from .permissions import (
     IsStudyingOwnerPermission, IsStaffPermission,
-    IsManagerOrSuperUserPermission
+    IsManagerOrSuperUserPermission, IsSuperUserPermission, get_principal
 )
 from .serializers import (
     ProgramSerializer, ProgramCRUDSerializer, ThemeCRUDSerializer, LessonCRUDSerializer,
     StudentSerializer, StudentAccessSerializer, LessonSerializer, StudyingSerializer, LessonThemeSerializer,
     StudentShortSerializer, StudentLessonsPassedSerializer, ProgramShortSerializer, LessonMicroSerializer,
-    ThemeSerializer
+    ThemeSerializer, VersionBulkApproveSerializer, LessonMoveSerializer, StudyingBatchSerializer
 )
+from .tasks import run_after_commit
 
 
 # ----------------------------------------------------------------------------------------------------------------------
@@ -34,13 +53,12 @@ class ProgramApproveAPIView(APIView):
 
     def get(self, request, pk):
         program = Program.objects.get(pk=pk)
-        versions = Version.objects.get_for_object(program)
+        versions = Version.objects.get_for_object(program).select_related('revision__user')
         not_approved = []
 
         for version in versions:
-            field_dict = version.field_dict
+            field_dict = version_cache.field_dict(version, editor_field='first_name')
             field_dict['version_id'] = version.id
-            field_dict['editor'] = version.revision.user.first_name
             if field_dict['is_approved'] is False:
                 not_approved.append(field_dict)
             else:
@@ -50,12 +68,11 @@ class ProgramApproveAPIView(APIView):
     def put(self, request, pk):
         data = request.data
         version_id = data["version_id"]
-        work_version = Version.objects.get(pk=version_id)
-        field_dict = work_version.field_dict
         program = Program.objects.get(pk=pk)
         if data['approved'] is False:
-            work_version.delete()
+            Version.objects.get(pk=version_id).delete()
         else:
+            field_dict = version_cache.field_dict(version_id)
             program.is_approved = True
             program.title = field_dict['title']
             program.description = field_dict['description']
@@ -68,22 +85,21 @@ class ProgramHistoryRollBackAPIView(APIView):
 
     def get(self, request, pk):
         program = Program.objects.get(pk=pk)
-        versions = Version.objects.get_for_object(program)
+        paginator = KeysetPagination()
+        versions = paginator.paginate_queryset(program.approved_versions().select_related('revision__user'), request)
         history = []
         for version in versions:
-            field_dict = version.field_dict
+            field_dict = version_cache.field_dict(version)
             field_dict['version_id'] = version.id
-            field_dict['editor'] = version.revision.user.username
             if field_dict['is_approved']:
                 history.append(field_dict)
 
-        return Response(history)
+        return paginator.get_paginated_response(history)
 
     def put(self, request, pk):
         data = request.data
         version_id = data["version_id"]
-        work_version = Version.objects.get(pk=version_id)
-        field_dict = work_version.field_dict
+        field_dict = version_cache.field_dict(version_id)
         program = Program.objects.get(pk=pk)
         program.is_approved = True
         program.title = field_dict['title']
@@ -92,16 +108,26 @@ class ProgramHistoryRollBackAPIView(APIView):
         return Response(ProgramSerializer(program).data)
 
 
-class ProgramStudentsAmountListAPIView(generics.ListAPIView):
+class ProgramStudentsAmountListAPIView(LeanListMixin, generics.ListAPIView):
     serializer_class = ProgramShortSerializer
+    lean_serializer_class = LeanProgramShortSerializer
     permission_classes = [IsManagerOrSuperUserPermission]
-    queryset = Program.objects.annotate(student_amount=Count('students'))
+    queryset = Program.objects.only('title', 'student_count')
+    stream_chunk_size = 2000
+
+    def list(self, request, *args, **kwargs):
+        if self.is_streamed(request):
+            return super().list(request, *args, **kwargs)
+        return Response(enrollment_cache.get_or_set(
+            'program-students-amount', lambda: list(self.get_serializer(self.get_queryset(), many=True).data)
+        ))
 
 
+@method_decorator(condition(etag_func=program_list_etag), name='get')
 class ProgramListAPIView(APIView):
 
     def get(self, request):
-        programs = Program.objects.all()
+        programs = Program.objects.with_published_versions()
         approve_program_list = []
         for program in programs:
             approve_program_list.append(program.actual_version)
@@ -133,13 +159,12 @@ class ThemeApproveAPIView(APIView):
 
     def get(self, request, pk):
         theme = Theme.objects.get(pk=pk)
-        versions = Version.objects.get_for_object(theme)
+        versions = Version.objects.get_for_object(theme).select_related('revision__user')
         not_approved = []
 
         for version in versions:
-            field_dict = version.field_dict
+            field_dict = version_cache.field_dict(version)
             field_dict['version_id'] = version.id
-            field_dict['editor'] = version.revision.user.username
             if field_dict['is_approved'] is False:
                 not_approved.append(field_dict)
             else:
@@ -149,12 +174,11 @@ class ThemeApproveAPIView(APIView):
     def put(self, request, pk):
         data = request.data
         version_id = data["version_id"]
-        work_version = Version.objects.get(pk=version_id)
-        field_dict = work_version.field_dict
         theme = Theme.objects.get(pk=pk)
         if data['approved'] is False:
-            work_version.delete()
+            Version.objects.get(pk=version_id).delete()
         else:
+            field_dict = version_cache.field_dict(version_id)
             theme.is_approved = True
             theme.program_id = field_dict['program_id']
             theme.title = field_dict['title']
@@ -168,22 +192,21 @@ class ThemeHistoryRollBackAPIView(APIView):
 
     def get(self, request, pk):
         theme = Theme.objects.get(pk=pk)
-        versions = Version.objects.get_for_object(theme)
+        paginator = KeysetPagination()
+        versions = paginator.paginate_queryset(theme.approved_versions().select_related('revision__user'), request)
         history = []
         for version in versions:
-            field_dict = version.field_dict
+            field_dict = version_cache.field_dict(version)
             field_dict['version_id'] = version.id
-            field_dict['editor'] = version.revision.user.username
             if field_dict['is_approved']:
                 history.append(field_dict)
 
-        return Response(history)
+        return paginator.get_paginated_response(history)
 
     def put(self, request, pk):
         data = request.data
         version_id = data["version_id"]
-        work_version = Version.objects.get(pk=version_id)
-        field_dict = work_version.field_dict
+        field_dict = version_cache.field_dict(version_id)
         theme = Theme.objects.get(pk=pk)
         theme.is_approved = True
         theme.program_id = field_dict['program_id']
@@ -206,13 +229,23 @@ class LessonViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         program_id = self.kwargs['program_id']
-        serializer.save(editor=self.request.user, program_id=program_id)
+        insert = 'after' in serializer.validated_data
+        after = serializer.validated_data.pop('after', None)
+        if after is not None and str(after.program_id) != str(program_id):
+            raise ValidationError({'after': 'Lesson does not belong to the program.'})
+
+        # One transaction, so the unlock pass queued by the save sees the lesson at its final position.
+        with transaction.atomic():
+            lesson = serializer.save(editor=self.request.user, program_id=program_id)
+            if insert:
+                lesson.insert_after(after and after.pk)
 
     def perform_update(self, serializer):
         serializer.save(editor=self.request.user)
         serializer.save(is_approved=False)
 
 
+@method_decorator(condition(etag_func=program_content_etag('lessons')), name='get')
 class LessonListAPIView(APIView):
     permission_classes = [IsStaffPermission]
 
@@ -220,22 +253,21 @@ class LessonListAPIView(APIView):
         approve_lesson_list = []
         program_id = self.kwargs['program_id']
 
-        for lesson in Lesson.objects.filter(program_id=program_id):
-            for version in Version.objects.get_for_object(lesson):
-                field_dict = version.field_dict
-                field_dict['version_id'] = version.id
-                field_dict['editor'] = version.revision.user.username
-                if field_dict['is_approved']:
-                    approve_lesson_list.append(field_dict)
-                    break
+        for lesson in Lesson.objects.filter(program_id=program_id).with_published_versions():
+            published = lesson.published_version
+            if published is not None:
+                field_dict = published.actual_field_dict
+                field_dict['version_id'] = published.version_id
+                approve_lesson_list.append(field_dict)
 
         return Response(approve_lesson_list)
 
 
-class LessonForApproveListAPIView(generics.ListAPIView):
+class LessonForApproveListAPIView(LeanListMixin, generics.ListAPIView):
     queryset = Lesson.objects.filter(is_approved=False)
     permission_classes = [IsManagerOrSuperUserPermission]
     serializer_class = LessonSerializer
+    lean_serializer_class = LeanLessonSerializer
 
 
 class LessonApproveAPIView(APIView):
@@ -243,13 +275,12 @@ class LessonApproveAPIView(APIView):
 
     def get(self, request, pk):
         lesson = Lesson.objects.get(pk=pk)
-        versions = Version.objects.get_for_object(lesson)
+        versions = Version.objects.get_for_object(lesson).select_related('revision__user')
         not_approved = []
 
         for version in versions:
-            field_dict = version.field_dict
+            field_dict = version_cache.field_dict(version)
             field_dict['version_id'] = version.id
-            field_dict['editor'] = version.revision.user.username
             if field_dict['is_approved'] is False:
                 not_approved.append(field_dict)
             else:
@@ -259,14 +290,11 @@ class LessonApproveAPIView(APIView):
     def put(self, request, pk):
         data = request.data
         version_id = data["version_id"]
-        work_version = Version.objects.get(pk=version_id)
-        field_dict = work_version.field_dict
         lesson = Lesson.objects.get(pk=pk)
-        print(data)
         if data['approved'] is False:
-            print(work_version.id)
-            work_version.delete()
+            Version.objects.get(pk=version_id).delete()
         else:
+            field_dict = version_cache.field_dict(version_id)
             lesson.is_approved = True
             lesson.program_id = field_dict['program_id']
             lesson.theme_id = field_dict['theme_id']
@@ -283,22 +311,21 @@ class LessonHistoryRollBackAPIView(APIView):
 
     def get(self, request, pk):
         lesson = Lesson.objects.get(pk=pk)
-        versions = Version.objects.get_for_object(lesson)
+        paginator = KeysetPagination()
+        versions = paginator.paginate_queryset(lesson.approved_versions().select_related('revision__user'), request)
         history = []
         for version in versions:
-            field_dict = version.field_dict
+            field_dict = version_cache.field_dict(version)
             field_dict['version_id'] = version.id
-            field_dict['editor'] = version.revision.user.username
             if field_dict['is_approved']:
                 history.append(field_dict)
 
-        return Response(history)
+        return paginator.get_paginated_response(history)
 
     def put(self, request, pk):
         data = request.data
         version_id = data["version_id"]
-        work_version = Version.objects.get(pk=version_id)
-        field_dict = work_version.field_dict
+        field_dict = version_cache.field_dict(version_id)
         lesson = Lesson.objects.get(pk=pk)
         lesson.is_approved = True
         lesson.program_id = field_dict['program_id']
@@ -311,27 +338,78 @@ class LessonHistoryRollBackAPIView(APIView):
         return Response(LessonSerializer(lesson).data)
 
 
-class LessonThemeListAPIView(APIView):
+class LessonChainListAPIView(APIView):
     permission_classes = [IsStaffPermission]
 
     def get(self, request, **kwargs):
-        program_id = self.kwargs.get('program_id')
-        themes = Theme.objects.filter(program_id=program_id).prefetch_related('lessons')
-        lessons = Lesson.objects.filter(program_id=program_id).select_related('theme')
-        approve_lesson_list = []
-        without_theme = []
+        lessons = list(Lesson.objects.chain(self.kwargs['program_id']))
+        published = PublishedVersion.objects.get_for_objects(lessons)
+        chain = []
 
         for lesson in lessons:
-            approve_lesson_list.append(lesson.actual_version)
+            if lesson.pk in published:
+                field_dict = published[lesson.pk].actual_field_dict
+                field_dict['position'] = lesson.position
+                chain.append(field_dict)
 
-        for lesson in approve_lesson_list:
-            if lesson['theme_id'] is None:
-                without_theme.append(lesson)
+        return Response(chain)
 
-        return Response({
-            'with_theme': LessonThemeSerializer(themes, many=True).data,
-            'without_theme': without_theme
-        })
+
+class LessonMoveAPIView(APIView):
+    permission_classes = [IsStaffPermission]
+
+    def put(self, request, pk):
+        lesson = Lesson.objects.get(pk=pk)
+        serializer = LessonMoveSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        after = serializer.validated_data['after']
+        if after is not None and (after.pk == lesson.pk or after.program_id != lesson.program_id):
+            raise ValidationError({'after': 'Lesson must be another lesson of the same program.'})
+
+        lesson.move_after(after and after.pk)
+        return Response(LessonCRUDSerializer(lesson).data)
+
+
+class LessonImportAPIView(APIView):
+    permission_classes = [IsStaffPermission]
+
+    def post(self, request, **kwargs):
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise ValidationError({'file': 'This field is required.'})
+        program = get_object_or_404(Program.objects.only('pk'), pk=self.kwargs['program_id'])
+        # Not ``format``, which DRF takes as the renderer override.
+        file_format = request.query_params.get('file_format') or upload.name.rsplit('.', 1)[-1]
+        imported = import_lessons(
+            program.pk, read_rows(codecs.iterdecode(upload, 'utf-8'), file_format), request.user
+        )
+        return Response({'imported': imported}, status=status.HTTP_201_CREATED)
+
+
+@method_decorator(condition(etag_func=program_content_etag('lesson-themes')), name='get')
+class LessonThemeListAPIView(APIView):
+    permission_classes = [IsStaffPermission]
+
+    def get(self, request, **kwargs):
+        program_id = self.kwargs.get('program_id')
+        generation = Program.objects.filter(pk=program_id).values_list('content_generation', flat=True).first()
+        if generation is None:
+            return Response(self.build_tree(program_id))
+        return Response(curriculum_cache.get_or_build(program_id, generation, lambda: self.build_tree(program_id)))
+
+    @staticmethod
+    def build_tree(program_id):
+        lessons = defaultdict(list)
+        for lesson in Lesson.objects.filter(program_id=program_id).with_published_versions():
+            actual_version = lesson.actual_version
+            if actual_version is not None:
+                lessons[lesson.theme_id].append(actual_version)
+
+        themes = Theme.objects.filter(program_id=program_id)
+        return {
+            'with_theme': LessonThemeSerializer(themes, many=True, context={'lessons': lessons}).data,
+            'without_theme': lessons[None],
+        }
 
 
 # ----------------------------------------------------------------------------------------------------------------------
@@ -345,17 +423,88 @@ class LessonEditorListAPIView(APIView):
     def get(self, request, **kwargs):
         approve_lesson_list = []
         editor_id = self.kwargs['editor_id']
-        lessons = Lesson.objects.filter(program_id=self.kwargs.get('program_id'), editor_id=editor_id)
+        lessons = Lesson.objects.filter(
+            program_id=self.kwargs.get('program_id'), editor_id=editor_id
+        ).with_published_versions()
 
         for lesson in lessons:
             approve_lesson_list.append(lesson.actual_version)
-            for version in Version.objects.get_for_object(lesson):
-                field_dict = version.field_dict
-                field_dict['editor'] = version.revision.user.username
 
         return Response(approve_lesson_list)
 
 
+# ----------------------------------------------------------------------------------------------------------------------
+# ____________________________________________________Version Block____________________________________________________
+# ----------------------------------------------------------------------------------------------------------------------
+class VersionBulkApproveAPIView(APIView):
+    permission_classes = [IsManagerOrSuperUserPermission]
+    approve_fields = {
+        Program: ('title', 'description'),
+        Theme: ('program_id', 'title', 'description'),
+        Lesson: ('program_id', 'theme_id', 'title', 'theory', 'practice', 'answer'),
+    }
+
+    def put(self, request):
+        serializer = VersionBulkApproveSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        decisions = {item['version_id']: item['approved'] for item in serializer.validated_data['versions']}
+
+        versions = Version.objects.select_related('content_type', 'revision__user').in_bulk(decisions)
+        missing = [version_id for version_id in decisions if version_id not in versions]
+        if missing:
+            raise ValidationError({'versions': f'Unknown version ids: {missing}'})
+
+        approved = defaultdict(dict)
+        for version_id, version in sorted(versions.items()):
+            model = version.content_type.model_class()
+            if model not in self.approve_fields:
+                raise ValidationError({'versions': f'Version {version_id} does not belong to editable content.'})
+            if not decisions[version_id]:
+                continue
+            object_id = int(version.object_id)
+            if object_id in approved[model]:
+                raise ValidationError({'versions': (
+                    f'Versions {approved[model][object_id][0]} and {version_id} approve the same '
+                    f'{model._meta.model_name} {object_id}.'
+                )})
+            approved[model][object_id] = (version_id, version_cache.field_dict(version))
+
+        rejected = [version_id for version_id, is_approved in decisions.items() if not is_approved]
+        applied = defaultdict(dict)
+
+        with transaction.atomic(), reversion.create_revision():
+            reversion.set_user(request.user)
+            Version.objects.filter(pk__in=rejected).delete()
+
+            for model, field_dicts in approved.items():
+                fields = self.approve_fields[model]
+                # Objects deleted since their version was saved are skipped.
+                objs = model.objects.in_bulk(field_dicts).values()
+                for obj in objs:
+                    version_id, field_dict = field_dicts[obj.pk]
+                    obj.is_approved = True
+                    for field in fields:
+                        setattr(obj, field, field_dict[field])
+                    reversion.add_to_revision(obj)
+                    applied[model][obj.pk] = version_id
+                model.objects.bulk_update(objs, ('is_approved',) + fields)
+
+            # bulk_update sends no post_save, so the work of its handlers is done here: cached
+            # enrollment lists carry program titles, and approved lessons are unlocked.
+            if applied.get(Program):
+                transaction.on_commit(enrollment_cache.invalidate)
+            for lesson_id in applied.get(Lesson, ()):
+                run_after_commit(Studying.objects.unlock_lesson, lesson_id)
+
+        applied_ids = {version_id for version_ids in applied.values() for version_id in version_ids.values()}
+        approved_ids = [version_id for version_id, is_approved in decisions.items() if is_approved]
+        return Response({
+            'approved': [version_id for version_id in approved_ids if version_id in applied_ids],
+            'rejected': rejected,
+            'skipped': [version_id for version_id in approved_ids if version_id not in applied_ids],
+        })
+
+
 # ----------------------------------------------------------------------------------------------------------------------
 # ____________________________________________________Student Block____________________________________________________
 # ----------------------------------------------------------------------------------------------------------------------
@@ -381,38 +530,68 @@ class StudentAccessViewSet(viewsets.ModelViewSet):
     http_method_names = ['get', 'patch']
 
 
-class StudyingViewSet(viewsets.ModelViewSet):
+class StudyingViewSet(LeanListMixin, viewsets.ModelViewSet):
     queryset = Studying.objects.select_related('lesson')
     serializer_class = StudyingSerializer
+    lean_serializer_class = LeanStudyingSerializer
     permission_classes = [IsStudyingOwnerPermission]
     http_method_names = ['get', 'retrieve', 'patch']
 
     def get_queryset(self, **kwargs):
-        user = self.request.user
-        return self.queryset.filter(student__user=user, passed=False)
+        return self.queryset.filter(student_id=get_principal(self.request).student_id, passed=False)
+
+    def perform_update(self, serializer):
+        studying = serializer.instance
+        studying.submit(serializer.validated_data.get('answer', studying.answer))
+
+
+class StudyingBatchSubmitAPIView(APIView):
+    permission_classes = [IsStudyingOwnerPermission]
+
+    def post(self, request):
+        serializer = StudyingBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        answers = [dict(item) for item in serializer.validated_data['answers']]
+        return Response(Studying.objects.submit_batch(get_principal(request).student_id, answers))
 
 
-class AvailableLessonProgramListAPIView(generics.ListAPIView):
+@method_decorator(condition(etag_func=available_lessons_etag), name='get')
+class AvailableLessonProgramListAPIView(LeanListMixin, generics.ListAPIView):
     serializer_class = StudyingSerializer
+    lean_serializer_class = LeanStudyingSerializer
     permission_classes = [IsStudyingOwnerPermission]
 
     def get_queryset(self, **kwargs):
         return Studying.objects.select_related('lesson').filter(
             lesson__program_id=self.kwargs.get('program_id'),
-            student__user=self.request.user
-        ).distinct()
+            student_id=get_principal(self.request).student_id
+        )
 
 
-class StudentLessonsPassedListAPIIView(generics.ListAPIView):
+class StudentLessonsPassedListAPIIView(LeanListMixin, generics.ListAPIView):
     serializer_class = StudentLessonsPassedSerializer
+    lean_serializer_class = LeanStudentLessonsPassedSerializer
     permission_classes = [IsManagerOrSuperUserPermission]
-    queryset = Student.objects.annotate(amount_passed_lesson=Count(Case(When(studying__passed=True, then=1))))
+    pagination_class = KeysetPagination
+    queryset = Student.objects.annotate(amount_passed_lesson=Coalesce(Sum('progress__passed_count'), 0))
+    stream_chunk_size = 2000
 
 
-class StudentProgramSubscribedListAPIIView(generics.ListAPIView):
+class StudentProgramSubscribedListAPIIView(LeanListMixin, generics.ListAPIView):
     serializer_class = StudentShortSerializer
+    lean_serializer_class = LeanStudentShortSerializer
     permission_classes = [IsManagerOrSuperUserPermission]
+    stream_chunk_size = 2000
 
     def get_queryset(self, **kwargs):
         return Student.objects.filter(open_programs=self.kwargs['program_id'])
 
+
+# ----------------------------------------------------------------------------------------------------------------------
+# _____________________________________________________Cache Block_____________________________________________________
+# ----------------------------------------------------------------------------------------------------------------------
+class CacheStatsAPIView(APIView):
+    permission_classes = [IsSuperUserPermission]
+
+    def get(self, request):
+        return Response({namespace: cache.stats() for namespace, cache in namespaces.items()})